@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks for the lane pipeline and the telemetry codec, no CARLA needed.
+
+Lane detection runs on synthetic BGRA road frames (as carla.Image delivers
+them) at several resolutions, with extra clutter segments to load Hough and
+the fitting stage. Telemetry covers Server.calculate_rpm, encoding and
+send_data without subscribers, Client parsing and the history ring.
+
+    python Benchmarks/Benchmark_Suite.py --json before.json
+    python Benchmarks/Benchmark_Suite.py --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'Carla_App'))
+sys.path.insert(0, os.path.join(ROOT, 'Dashboard'))
+
+import cv2
+import numpy as np
+
+import Lane_Detection
+import UDP_Server
+import UDP_Client
+
+
+RESOLUTIONS = [(800, 600), (1280, 720), (1920, 1080)]
+CLUTTER = [0, 50, 200]  # extra random segments inside the ROI
+
+
+def synthetic_road(width, height, clutter=0, seed=0):
+    """Grey road with two lane markings converging to the horizon, BGRA."""
+    rng = np.random.default_rng(seed)
+    frame = np.empty((height, width, 4), dtype=np.uint8)
+    frame[:] = (90, 90, 90, 255)
+    frame[:height // 2] = (200, 160, 120, 255)  # sky
+
+    y_bottom = int(height * 0.85)
+    y_top = int(height * 0.56)
+    dx = int((y_bottom - y_top) / 0.85)
+    thickness = max(2, width // 200)
+    white = (255, 255, 255, 255)
+    cv2.line(frame, (int(width * 0.14), y_bottom), (int(width * 0.14) + dx, y_top), white, thickness)
+    cv2.line(frame, (int(width * 0.86), y_bottom), (int(width * 0.86) - dx, y_top), white, thickness)
+
+    # Cracks, shadows and road text: short segments at random angles
+    for _ in range(clutter):
+        x = int(rng.integers(0, width))
+        y = int(rng.integers(height // 2, y_bottom))
+        length = rng.integers(height // 40, height // 10)
+        angle = rng.uniform(0, np.pi)
+        end = (int(x + length * np.cos(angle)), int(y + length * np.sin(angle)))
+        shade = int(rng.integers(0, 255))
+        cv2.line(frame, (x, y), end, (shade, shade, shade, 255), thickness)
+    return frame
+
+
+def measure(fn, iterations, batch=1, warmup=3):
+    """Per-call latencies in seconds, each sample timing `batch` calls."""
+    for _ in range(warmup):
+        fn()
+    samples = np.empty(iterations)
+    for i in range(iterations):
+        t_start = time.perf_counter()
+        for _ in range(batch):
+            fn()
+        samples[i] = (time.perf_counter() - t_start) / batch
+    return samples
+
+
+def summarize(samples, batch):
+    return {
+        'ops_per_s': round(1.0 / samples.mean(), 1),
+        'mean_us': round(samples.mean() * 1e6, 3),
+        'p50_us': round(np.percentile(samples, 50) * 1e6, 3),
+        'p90_us': round(np.percentile(samples, 90) * 1e6, 3),
+        'p99_us': round(np.percentile(samples, 99) * 1e6, 3),
+        'samples': len(samples),
+        'batch': batch,
+    }
+
+
+def lane_cases(quick):
+    resolutions = RESOLUTIONS[:1] if quick else RESOLUTIONS
+    for width, height in resolutions:
+        for clutter in CLUTTER:
+            frame = synthetic_road(width, height, clutter)
+            detector = Lane_Detection.LaneDetector()
+            yield f"lanes/full/{width}x{height}/clutter{clutter}", lambda d=detector, f=frame: d.find_lanes(f), 1
+
+        frame = synthetic_road(width, height, CLUTTER[1])
+        detector = Lane_Detection.LaneDetector()
+        tracker = Lane_Detection.LaneTracker()
+        tracker.update(detector.find_lanes(frame))
+        prior = tracker.predict()
+        yield f"lanes/tracking/{width}x{height}/clutter{CLUTTER[1]}", \
+            lambda d=detector, f=frame, p=prior: d.find_lanes(f, p), 1
+
+        detector = Lane_Detection.LaneDetector(scale=0.5)
+        yield f"lanes/scale0.5/{width}x{height}/clutter{CLUTTER[1]}", lambda d=detector, f=frame: d.find_lanes(f), 1
+
+        detector = Lane_Detection.LaneDetector()
+        yield f"lanes/detect_road_lanes/{width}x{height}/clutter{CLUTTER[1]}", \
+            lambda d=detector, f=frame: d.detect_road_lanes(f), 1
+
+
+def decode_fresh(client, packet):
+    client.delta_state.clear()  # a repeated keyframe is dropped as a duplicate otherwise
+    return client.decode_packet(packet)
+
+
+def decode_keyframe_and_delta(client, keyframe, delta):
+    client.delta_state.clear()  # forget the state so the keyframe applies again
+    client.decode_packet(keyframe)
+    return client.decode_packet(delta)
+
+
+def telemetry_cases():
+    for wire_format in (UDP_Server.WIRE_TEXT, UDP_Server.WIRE_BINARY, UDP_Server.WIRE_DELTA):
+        # Port 0: an ephemeral port, no subscribers so send_data stops short of the network
+        server = UDP_Server.Server(ip="127.0.0.1", port=0, wire_format=wire_format)
+        yield f"telemetry/encode/{wire_format}", \
+            lambda s=server: s.encode_packet(1234, 1700000000.123456, 87, 2215, 90, 50, "4"), 100
+        yield f"telemetry/send_data/{wire_format}", lambda s=server: s.send_data(87), 100
+
+        if wire_format == UDP_Server.WIRE_DELTA:
+            # A keyframe and the delta after it, speed and rpm changed
+            client = UDP_Client.Client()
+            server.stream().keyframe_due = True
+            keyframe = server.encode_packet(1234, 1700000000.123456, 87, 2215, 90, 50, "4")
+            delta = server.encode_packet(1235, 1700000000.173456, 88, 2240, 90, 50, "4")
+            yield "client/decode/delta", lambda c=client, k=keyframe, d=delta: decode_keyframe_and_delta(c, k, d), 100
+            continue
+        client = UDP_Client.Client(wire_format=wire_format)
+        packet = server.encode_packet(1234, 1700000000.123456, 87, 2215, 90, 50, "4")
+        yield f"client/decode/{wire_format}", lambda c=client, p=packet: decode_fresh(c, p), 100
+
+    server = UDP_Server.Server(ip="127.0.0.1", port=0)
+    yield "telemetry/calculate_rpm", lambda s=server: s.calculate_rpm(87), 100
+
+    # A full client history ring, queried over the last minute of a 20 Hz feed
+    history = UDP_Client.TelemetryHistory()
+    sample = decode_fresh(client, packet)
+    for i in range(history.capacity):
+        history.append(sample, i * 0.05)
+    now = history.capacity * 0.05
+    yield "client/history/append", lambda h=history, s=sample: h.append(s, now), 100
+    yield "client/history/stats", lambda h=history: h.stats('SPEED', 60, now), 10
+    yield "client/history/series", lambda h=history: h.series('SPEED', 100, 60, now), 10
+    yield "client/history/rate", lambda h=history: h.rate('FUEL', 60, now), 10
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='Lane pipeline and telemetry benchmarks')
+    argparser.add_argument('--quick', action='store_true', help='800x600 only and fewer samples')
+    argparser.add_argument('--filter', metavar='TEXT', default='', help='only run cases containing TEXT')
+    argparser.add_argument('--json', metavar='FILE', help='write results to FILE')
+    argparser.add_argument('--compare', metavar='FILE', help='compare p50 against a previous --json FILE')
+    args = argparser.parse_args()
+
+    iterations = 20 if args.quick else 100
+    results = {}
+    cases = list(lane_cases(args.quick)) + list(telemetry_cases())
+    print('%-48s %12s %10s %10s %10s' % ('case', 'ops/s', 'p50 us', 'p90 us', 'p99 us'))
+    for name, fn, batch in cases:
+        if args.filter not in name:
+            continue
+        result = summarize(measure(fn, iterations, batch), batch)
+        results[name] = result
+        print('%-48s %12.1f %10.1f %10.1f %10.1f' % (
+            name, result['ops_per_s'], result['p50_us'], result['p90_us'], result['p99_us']))
+
+    report = {
+        'revision': git_revision(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nvs {args.compare} ({baseline.get('revision')}), p50, negative is faster")
+        for name, result in results.items():
+            before = baseline['results'].get(name)
+            if before:
+                change = 100.0 * (result['p50_us'] - before['p50_us']) / before['p50_us']
+                print('%-48s %10.1f -> %10.1f us %+8.1f%%' % (name, before['p50_us'], result['p50_us'], change))
+
+
+if __name__ == '__main__':
+    main()
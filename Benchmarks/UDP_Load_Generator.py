@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+
+"""
+Load generator for the UDP telemetry path, no CARLA needed.
+
+server: runs a UDP_Server.Server on localhost and drives send_data with
+synthetic speeds to --clients simulated subscribers in this process, one
+socket each, registering and ACKing like UDP_Client.Client. --payload
+sends raw datagrams of that size through send_packet instead, to see the
+fan-out cost against datagram size. Reports send calls/s, datagrams/s,
+sender CPU per call, receiver loss and latency, and the server's ACK RTT.
+
+client: plays the server for one UDP_Client.Client and replays a
+synthetic 20 Hz stream at --speedup times real time. Reports delivered
+samples/s, client thread CPU per datagram, coalesced and lost datagrams
+and latency.
+
+Both ends run on this host, so latencies compare the same clock.
+
+    python Benchmarks/UDP_Load_Generator.py server --clients 200 --rate 100 --wire binary
+    python Benchmarks/UDP_Load_Generator.py server --clients 50 --payload 1024
+    python Benchmarks/UDP_Load_Generator.py client --speedup 50 --receive latest --json client.json
+"""
+
+import argparse
+import json
+import platform
+import selectors
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+# Also puts Carla_App and Dashboard on sys.path
+from Benchmark_Suite import git_revision
+
+import UDP_Server
+import UDP_Client
+
+
+SAMPLE_RATE = 20.0  # Hz of the replayed stream at --speedup 1, the simulation's telemetry rate
+SUBSCRIBE_TIMEOUT = 5.0  # seconds to wait for the simulated clients / the client under test
+DRAIN_TIME = 0.5  # seconds left to the receivers after the last send
+RAW = struct.Struct("<Id")  # seq, send time at the start of a --payload datagram
+
+
+def synthetic_speeds(count, seed=0):
+    """km/h of a drive cycle: slow swings between 10 and 110 with some noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(count) / SAMPLE_RATE
+    speeds = 60 + 50 * np.sin(2 * np.pi * t / 60) + rng.normal(0, 1, count)
+    return np.clip(speeds, 0, 250).astype(int).tolist()
+
+
+def drive(send, count, rate):
+    """
+    Calls send(i) count times at rate Hz against absolute deadlines, back
+    to back with rate 0. Returns wall and calling thread CPU seconds.
+    """
+    period = 1.0 / rate if rate else 0.0
+    start = time.perf_counter()
+    cpu = time.thread_time()
+    for i in range(count):
+        if period:
+            delay = start + i * period - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        send(i)
+    return time.perf_counter() - start, time.thread_time() - cpu
+
+
+def merge_link_stats(stats):
+    # One LinkStats-like summary over many streams
+    latencies = sorted(latency for s in stats for latency in s.latencies)
+    snapshots = [s.snapshot() for s in stats]
+    received = sum(s['received'] for s in snapshots)
+    lost = sum(s['lost'] for s in snapshots)
+    to_ms = lambda v: None if v is None else round(v * 1000, 3)
+    return {
+        'received': received,
+        'coalesced': sum(s['coalesced'] for s in snapshots),
+        'lost': lost,
+        'loss': round(lost / (received + lost), 4) if received + lost else 0.0,
+        'reordered': sum(s['reordered'] for s in snapshots),
+        'latency_p50_ms': to_ms(UDP_Client.percentile(latencies, 0.50)),
+        'latency_p99_ms': to_ms(UDP_Client.percentile(latencies, 0.99)),
+    }
+
+
+class SimulatedClients:
+    """
+    count subscriber sockets served by one thread, decoding and ACKing every
+    datagram like UDP_Client.Client in RECEIVE_ALL mode. With raw set they
+    only read the RAW prefix of --payload datagrams.
+    """
+
+    def __init__(self, server_addr, count, vehicle_id=None, ack=True, raw=False, rcvbuf=None):
+        self.server_addr = server_addr
+        self.ack = ack
+        self.raw = raw
+        self.selector = selectors.DefaultSelector()
+        self.clients = []
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            if rcvbuf:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+            sock.bind(("127.0.0.1", 0))
+            sock.setblocking(False)
+            client = UDP_Client.ClientBase(history_size=0, vehicle_id=vehicle_id, ack=ack)
+            self.selector.register(sock, selectors.EVENT_READ, (sock, client))
+            self.clients.append((sock, client))
+        self.datagrams = 0
+        self.malformed = 0
+        self.cpu = 0.0
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='load-clients', daemon=True)
+        self.thread.start()
+
+    def subscribe(self):
+        for sock, client in self.clients:
+            sock.sendto(client.ready_message(), self.server_addr)
+
+    def link_stats(self):
+        return [stats for _, client in self.clients
+                for stats in (client.fleet_stats.values() if client.vehicle_id == UDP_Client.FLEET_ALL
+                              else [client.stats])]
+
+    def run(self):
+        cpu = time.thread_time()
+        while self.running:
+            for key, _ in self.selector.select(0.1):
+                sock, client = key.data
+                while True:
+                    try:
+                        data, addr = sock.recvfrom(65536)
+                    except (BlockingIOError, ConnectionResetError):
+                        break
+                    self.datagrams += 1
+                    if self.raw:
+                        seq, sent_time = RAW.unpack_from(data)
+                        client.stats.add(seq, sent_time, time.time())
+                        continue
+                    try:
+                        sample = client.decode_packet(data)
+                    except (ValueError, struct.error):
+                        self.malformed += 1
+                        continue
+                    if sample is None:
+                        continue
+                    ack = client.track(sample)
+                    if self.ack:
+                        sock.sendto(ack, addr)
+        self.cpu = time.thread_time() - cpu
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        for sock, _ in self.clients:
+            sock.sendto(b"BYE", self.server_addr)
+            self.selector.unregister(sock)
+            sock.close()
+
+
+def run_server(args):
+    server = UDP_Server.Server(ip="127.0.0.1", port=0, wire_format=args.wire)
+    server.start()
+    server_addr = server.sock.getsockname()
+    vehicle_ids = list(range(1, args.fleet + 1))
+    clients = SimulatedClients(server_addr, args.clients, UDP_Client.FLEET_ALL if args.fleet else None,
+                               ack=not args.no_ack, raw=bool(args.payload), rcvbuf=args.rcvbuf)
+    try:
+        clients.subscribe()
+        deadline = time.monotonic() + SUBSCRIBE_TIMEOUT
+        while len(server.targets) < args.clients and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if len(server.targets) < args.clients:
+            raise RuntimeError(f"Only {len(server.targets)} of {args.clients} simulated clients subscribed")
+
+        speeds = synthetic_speeds(args.count)
+        if args.payload:
+            padding = bytes(max(0, args.payload - RAW.size))
+
+            def send(i):
+                server.send_packet(RAW.pack(i, time.time()) + padding)
+        elif args.fleet:
+            def send(i):
+                for vehicle_id in vehicle_ids:
+                    server.send_data(speeds[i], vehicle_id)
+        else:
+            def send(i):
+                server.send_data(speeds[i])
+
+        wall, cpu = drive(send, args.count, args.rate)
+        time.sleep(DRAIN_TIME)
+    finally:
+        clients.close()
+        server.stop()
+
+    sends = args.count * max(args.fleet, 1)
+    datagrams = sends * args.clients
+    return dict({
+        'role': 'server',
+        'wire': 'raw' if args.payload else args.wire,
+        'payload_bytes': args.payload or None,
+        'clients': args.clients,
+        'fleet': args.fleet,
+        'rate_hz': args.rate,
+        'sends': sends,
+        'sends_per_s': round(sends / wall, 1),
+        'datagrams_per_s': round(datagrams / wall, 1),
+        'sender_cpu_us_per_send': round(1e6 * cpu / sends, 3),
+        'sender_cpu_us_per_datagram': round(1e6 * cpu / datagrams, 3),
+        'receiver_cpu_us_per_datagram': round(1e6 * clients.cpu / max(clients.datagrams, 1), 3),
+        'malformed': clients.malformed,
+    }, **merge_link_stats(clients.link_stats()),
+       **{'server_' + key: value for key, value in server.stats.snapshot().items()})
+
+
+def run_client(args):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(SUBSCRIBE_TIMEOUT)
+    encoder = UDP_Server.ServerBase(wire_format=args.wire)
+    client = UDP_Client.Client(udp_ip="127.0.0.1", udp_port=sock.getsockname()[1],
+                               receive_mode=args.receive, rcvbuf=args.rcvbuf, ack=not args.no_ack)
+
+    # Client thread CPU between the first and the last delivered sample
+    delivered = [0, None, None]
+
+    def callback():
+        now = time.thread_time()
+        if delivered[1] is None:
+            delivered[1] = now
+        delivered[0] += 1
+        delivered[2] = now
+
+    client.client_thread(callback)
+    try:
+        try:
+            data, addr = sock.recvfrom(512)
+        except socket.timeout:
+            raise RuntimeError("Client under test did not send READY")
+        if not data.startswith(b"READY"):
+            raise RuntimeError(f"Expected READY, got {data!r}")
+        sock.setblocking(False)  # ACKs are left unread, the socket drops them when full
+
+        speeds = synthetic_speeds(args.count)
+
+        def send(i):
+            gear, rpm = encoder.calculate_rpm(speeds[i])
+            sock.sendto(encoder.encode_packet(i, time.time(), speeds[i], rpm, 90, 50, gear), addr)
+
+        wall, cpu = drive(send, args.count, SAMPLE_RATE * args.speedup)
+        time.sleep(DRAIN_TIME)
+    finally:
+        client.close()
+        sock.close()
+
+    link = client.stats.snapshot()
+    handled = link['received'] + link['coalesced']
+    client_cpu = 0.0 if delivered[1] is None else delivered[2] - delivered[1]
+    return dict({
+        'role': 'client',
+        'wire': args.wire,
+        'receive_mode': args.receive,
+        'speedup': args.speedup,
+        'sent': args.count,
+        'sent_per_s': round(args.count / wall, 1),
+        'delivered': delivered[0],
+        'delivered_per_s': round(delivered[0] / wall, 1),
+        'sender_cpu_us_per_packet': round(1e6 * cpu / args.count, 3),
+        'client_cpu_us_per_datagram': round(1e6 * client_cpu / max(handled - 1, 1), 3),
+        'resyncs': client.resyncs,
+    }, **link)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='UDP telemetry load generator')
+    roles = argparser.add_subparsers(dest='role', required=True)
+
+    server = roles.add_parser('server', help='drive UDP_Server.Server to many simulated clients')
+    server.add_argument('--clients', metavar='N', type=int, default=10, help='simulated subscribers (default: 10)')
+    server.add_argument('--rate', metavar='HZ', type=float, default=0.0,
+                        help='send_data calls per second, 0 for back to back (default: 0)')
+    server.add_argument('--fleet', metavar='N', type=int, default=0,
+                        help='send N id-tagged vehicle streams per call, clients subscribe to all (default: 0, off)')
+    server.add_argument('--payload', metavar='BYTES', type=int, default=0,
+                        help='send raw datagrams of BYTES through send_packet instead of samples')
+
+    client = roles.add_parser('client', help='replay a stream into UDP_Client.Client')
+    client.add_argument('--speedup', metavar='X', type=float, default=10.0,
+                        help='times the %.0f Hz real-time rate, 0 for back to back (default: 10)' % SAMPLE_RATE)
+    client.add_argument('--receive', choices=[UDP_Client.RECEIVE_ALL, UDP_Client.RECEIVE_LATEST],
+                        default=UDP_Client.RECEIVE_ALL, help='client receive mode (default: all)')
+
+    for role in (server, client):
+        role.add_argument('--wire', choices=[UDP_Server.WIRE_TEXT, UDP_Server.WIRE_BINARY, UDP_Server.WIRE_DELTA],
+                          default=UDP_Server.WIRE_BINARY, help='wire format (default: binary)')
+        role.add_argument('--count', metavar='N', type=int, default=2000, help='packets to send (default: 2000)')
+        role.add_argument('--rcvbuf', metavar='BYTES', type=int, default=None,
+                          help='receive buffer size of the client sockets (default: OS default)')
+        role.add_argument('--no-ack', action='store_true', help='clients do not ACK')
+        role.add_argument('--json', metavar='FILE', help='write the report to FILE')
+    args = argparser.parse_args()
+    if args.role == 'server' and args.payload and args.fleet:
+        argparser.error('--payload sends untagged raw datagrams, it does not combine with --fleet')
+
+    result = run_server(args) if args.role == 'server' else run_client(args)
+    for key, value in result.items():
+        print('%-32s %s' % (key, value))
+
+    if args.json:
+        report = {
+            'revision': git_revision(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'result': result,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,12 +14,19 @@ It can easily be configure for any different number of sensors.
 To do that, check lines 290-308.
 """
 
+import collections
 import glob
+import json
 import os
 import sys
-import cv2
 import math
+import threading
 import UDP_Server
+import SHM_Server
+import Lane_Detection
+import Frame_Recorder
+import Stage_Profiler
+import Frame_Scheduler
 
 
 try:
@@ -30,7 +37,12 @@ try:
 except IndexError:
     pass
 
-import carla
+try:
+    import carla
+except ImportError:
+    # Only --replay works without the CARLA client library
+    carla = None
+
 import argparse
 import random
 import time
@@ -44,6 +56,17 @@ try:
 except ImportError:
     raise RuntimeError('cannot import pygame, make sure pygame package is installed')
 
+STATUS_INTERVAL = 1.0  # seconds between FPS/speed status lines
+FIXED_DELTA_SECONDS = 0.05  # simulation step in synchronous mode
+TRAFFIC_MANAGER_PORT = 8000
+
+# Camera rig used without --cameras: one front camera filling the window
+DEFAULT_CAMERAS = {
+    'cameras': [
+        {'name': 'front', 'pos': [0, 0], 'location': {'x': 1.2, 'z': 1.5}, 'rotation': {'yaw': 0}},
+    ],
+}
+
 class CustomTimer:
     def __init__(self):
         try:
@@ -99,18 +122,44 @@ class DisplayManager:
 class SensorManager:
     cont = 0
 
-    def __init__(self, world, display_man, sensor_type, transform, attached, sensor_options, display_pos):
+    def __init__(self, world, display_man, sensor_type, transform, attached, sensor_options, display_pos,
+                 lane_workers=1, lane_executor='thread', lane_tracking=False, lane_length_weighted=False,
+                 lane_scale=1.0, lane_budget=None, recorder=None, profiler=None):
         self.surface = None
+        self.recorder = recorder
+        self.profiler = profiler
         self.world = world
         self.display_man = display_man
         self.display_pos = display_pos
-        self.sensor = self.init_sensor(sensor_type, transform, attached, sensor_options)
-        self.sensor_options = sensor_options
         self.timer = CustomTimer()
 
         self.time_processing = 0.0
         self.tics_processing = 0
 
+        # Double-buffered BGRA frames, each wrapped once by a pygame Surface sharing its memory.
+        # The processor writes the back buffer, render() blits the front one
+        self.buffers = None
+        self.surfaces = None
+        self.back = 0
+        self.surface_lock = threading.Lock()
+
+        # Latest frame id with published lanes, for loops that wait on a tick's frame
+        self.published_frame = -1
+        self.frame_done = threading.Condition()
+
+        # Lane detection runs off the sensor callback, stale frames are dropped
+        self.detector = Lane_Detection.LaneDetector(length_weighted=lane_length_weighted, scale=lane_scale)
+        self.detector.profiler = profiler
+        self.tracker = Lane_Detection.LaneTracker() if lane_tracking else None
+        # Optional per-frame time budget (s): trade detection quality for a steady frame rate
+        self.quality = Lane_Detection.QualityController(self.detector, lane_budget) if lane_budget else None
+        self.processor = Lane_Detection.FrameProcessor(self.detector, self.lanes_ready,
+                                                       workers=lane_workers, executor=lane_executor,
+                                                       tracker=self.tracker, controller=self.quality)
+
+        self.sensor = self.init_sensor(sensor_type, transform, attached, sensor_options)
+        self.sensor_options = sensor_options
+
         self.display_man.add_sensor(self)
 
     def init_sensor(self, sensor_type, transform, attached, sensor_options):
@@ -136,102 +185,181 @@ class SensorManager:
 
 
     def make_coordinates(self, image, line_parameter):
-      slope, intercept = line_parameter
-      y1 = image.shape[0]
-      y2 = int(y1 * (3 / 5))
-      x1 = int((y1 - intercept) / slope)
-      x2 = int((y2 - intercept) / slope)
-      return np.array([x1, y1, x2, y2])        
-    
+        return self.detector.make_coordinates(image, line_parameter)
+
     def detect_road_lanes(self, image):
-      #Canny function
-      gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-      blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-      Canny_img = cv2.Canny(blurred, 50, 150)
-
-       
-      #Region of interest
-      height = Canny_img.shape[0]
-      polygons = np.array([[(0,height-80),(800,height-80),(400,300)]])
-      mask = np.zeros_like(Canny_img)
-      cv2.fillPoly(mask, polygons, [255,255,255])      
-      masked_image = cv2.bitwise_and(Canny_img, mask)
-
-      #Step 10: Apply Hough Line Transform to detect straight lines in the ROI
-      lines = cv2.HoughLinesP(masked_image, 2, np.pi / 180, threshold=50, minLineLength=10, maxLineGap=5)
-       
-      # Step 11: Draw the lines on the original image
-      lane_image = np.copy(image)
-      
-      left_fit = []
-      right_fit = []
-      if lines is not None:
-        for line in lines:
-          x1, y1, x2, y2 = line.reshape(4)
-          parameters = np.polyfit((x1, x2), (y1, y2), 1)
-          slope = parameters[0]
-          intercept = parameters[1]
-          
-          if slope > 0.5 and slope < 1.5:
-            right_fit.append((slope, intercept))
-          elif slope < -0.5 and slope > -1.5:
-            left_fit.append((slope, intercept)) 
-
-        if len(left_fit) > 0: 
-          left_fit_average = np.average(left_fit, axis=0)
-          left_line = self.make_coordinates(lane_image, left_fit_average)    
-          x1, y1, x2, y2 = left_line
-          parameters = np.polyfit((x1, x2), (y1, y2), 1)
-          slope = parameters[0]
-          if slope < -0.7 and slope > -1.0:
-            cv2.line(lane_image, (x1, y1), (x2, y2), (0, 0, 255), 3)
-            #print("left_line", len(left_line))
+        return self.detector.detect_road_lanes(image)
 
-        
-        if len(right_fit) > 0:      
-          right_fit_average = np.average(right_fit, axis=0)
-          right_line = self.make_coordinates(lane_image, right_fit_average)
-          x1, y1, x2, y2 = right_line
-          parameters = np.polyfit((x1, x2), (y1, y2), 1)
-          slope = parameters[0]  
-          if slope > 0.7 and slope < 1.0:
-           cv2.line(lane_image, (x1, y1), (x2, y2), (0, 0, 255), 3)
-
-
-        #if lines is not None:
-        #    for line in lines:
-        #        x1, y1, x2, y2 = line[0]
-        #        slope = (y2 - y1) / (x2 - x1)
-        #        if (slope > 0.5 and slope < 1.5) or (slope < -0.5 and slope > -1.5):
-        #            cv2.line(lane_image, (x1, y1), (x2, y2), (0, 255, 0), 3)  # Green lines for lane
-
-      
-      return lane_image
-       
-    
     def save_rgb_image(self, image):
-        t_start = self.timer.time()
-        image.convert(carla.ColorConverter.Raw)
+        # Runs on the CARLA callback thread: wrap the BGRA buffer without copying
+        # and hand it to the processor, which keeps the image alive until published
+        if carla is not None:
+            image.convert(carla.ColorConverter.Raw)
+        if self.recorder is not None:
+            self.recorder.add_image(image)
         array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
         array = np.reshape(array, (image.height, image.width, 4))
-        array = array[:, :, :3]
-        array = array[:, :, ::-1]
-        lane_image = self.detect_road_lanes(array)
-
-        if self.display_man.render_enabled():
-            self.surface = pygame.surfarray.make_surface(lane_image.swapaxes(0, 1))
+        self.processor.submit(image.frame, array, image)
+
+    def lanes_ready(self, frame_id, frame, lanes, elapsed):
+        self.publish_lanes(frame_id, frame, lanes, elapsed)
+        with self.frame_done:
+            self.published_frame = max(self.published_frame, frame_id)
+            self.frame_done.notify_all()
+
+    def wait_for_frame(self, frame_id, timeout=1.0):
+        # True once lanes for frame_id (or a later frame that superseded it) are published
+        with self.frame_done:
+            return self.frame_done.wait_for(lambda: self.published_frame >= frame_id, timeout)
+
+    def publish_lanes(self, frame_id, frame, lanes, elapsed):
+        # elapsed is None for a frame the quality level skipped, drawn with the last lanes
+        if elapsed is not None:
+            self.time_processing += elapsed
+            self.tics_processing += 1
+            if self.profiler:
+                self.profiler.record('lane.total', elapsed)
+        if self.profiler:
+            t = time.perf_counter()
+        if not self.display_man.render_enabled():
+            return
 
-        t_end = self.timer.time()
-        self.time_processing += (t_end-t_start)
-        self.tics_processing += 1
+        if self.buffers is None or self.buffers[0].shape != frame.shape:
+            size = (frame.shape[1], frame.shape[0])
+            self.buffers = [np.empty(frame.shape, dtype=np.uint8) for _ in range(2)]
+            self.surfaces = [pygame.image.frombuffer(buffer, size, 'BGRA') for buffer in self.buffers]
+
+        # The only per-frame copy: CARLA's buffer is read-only and recycled
+        buffer = self.buffers[self.back]
+        np.copyto(buffer, frame)
+        self.detector.draw_lanes(buffer, lanes)
+        with self.surface_lock:
+            self.surface = self.surfaces[self.back]
+            self.back ^= 1
+        if self.profiler:
+            self.profiler.lap('lane.surface', t)
 
     def render(self):
-        if self.surface is not None:
-            offset = self.display_man.get_display_offset(self.display_pos)
-            self.display_man.display.blit(self.surface, offset)
+        with self.surface_lock:
+            if self.surface is not None:
+                offset = self.display_man.get_display_offset(self.display_pos)
+                self.display_man.display.blit(self.surface, offset)
 
     def destroy(self):
-        self.sensor.destroy()
+        if self.sensor is not None:
+            self.sensor.destroy()
+        self.processor.shutdown()
+        if self.tics_processing:
+            print('Lane processing: %d frames, %.2f ms/frame, %d dropped, %d skipped' % (
+                self.tics_processing, 1000 * self.time_processing / self.tics_processing, self.processor.dropped,
+                self.processor.skipped))
+        if self.quality is not None:
+            print(f"Lane quality: {self.quality_status()}")
+
+    def quality_status(self):
+        status = self.quality.status()
+        return 'level %d/%d scale %.2f every %d frame(s) hough %d/%d, %s ms/frame of %.1f, %d changes' % (
+            status['level'], status['levels'] - 1, status['scale'], status['interval'],
+            status['hough_threshold'], status['hough_max_gap'],
+            '-' if status['frame_ms'] is None else '%.1f' % status['frame_ms'], status['budget_ms'],
+            status['changes'])
+
+def lane_options(args):
+    return dict(lane_workers=args.lane_workers, lane_executor=args.lane_executor,
+                lane_tracking=args.lane_tracking, lane_length_weighted=args.lane_length_weighted,
+                lane_scale=args.lane_scale,
+                lane_budget=args.lane_budget / 1000.0 if args.lane_budget else None)
+
+def make_telemetry(args):
+    if args.telemetry == 'shm':
+        return SHM_Server.ShmServer(name=args.shm_name)
+    return UDP_Server.Server(wire_format=args.wire, multicast_group=args.multicast,
+                             multicast_port=args.multicast_port)
+
+def make_profiler(args):
+    if not (args.profile or args.profile_udp):
+        return None
+    udp_addr = None
+    if args.profile_udp:
+        host, port = args.profile_udp.rsplit(':', 1)
+        udp_addr = (host, int(port))
+    return Stage_Profiler.StageProfiler(path=args.profile, udp_addr=udp_addr, interval=args.profile_interval)
+
+def load_cameras(path):
+    """
+    Camera rig from a JSON file, DEFAULT_CAMERAS without one:
+        {"grid": [rows, cols],
+         "cameras": [{"name": "front", "pos": [row, col],
+                      "location": {"x": 1.2, "z": 1.5}, "rotation": {"yaw": 0},
+                      "options": {"fov": "90"}}, ...]}
+    grid defaults to the smallest one holding every pos.
+    """
+    rig = DEFAULT_CAMERAS
+    if path:
+        with open(path) as f:
+            rig = json.load(f)
+    if not rig.get('cameras'):
+        raise ValueError(f"{path}: no cameras configured")
+    grid = rig.get('grid') or [max(camera['pos'][0] for camera in rig['cameras']) + 1,
+                               max(camera['pos'][1] for camera in rig['cameras']) + 1]
+    for camera in rig['cameras']:
+        if not (0 <= camera['pos'][0] < grid[0] and 0 <= camera['pos'][1] < grid[1]):
+            raise ValueError(f"Camera {camera.get('name')} at {camera['pos']} is outside the {grid} grid")
+    return dict(rig, grid=grid)
+
+def speed_kph(v):
+    return int(3.6 * math.sqrt(v.x**2 + v.y**2 + v.z**2))
+
+# Ego vehicle state at one tick, taken from that tick's WorldSnapshot
+VehicleState = collections.namedtuple('VehicleState', ['frame', 'timestamp', 'velocity', 'transform', 'control'])
+
+def vehicle_state(snapshot, vehicle):
+    """
+    The vehicle's state from the snapshot a tick already delivered, None when
+    the vehicle is not in it. get_control() returns the control received with
+    the last tick, so nothing here calls the simulator.
+    """
+    actor = snapshot.find(vehicle.id)
+    if actor is None:
+        return None
+    return VehicleState(snapshot.frame, snapshot.timestamp.elapsed_seconds, actor.get_velocity(),
+                        actor.get_transform(), vehicle.get_control())
+
+def spawn_fleet(client, world, count, tm_port=TRAFFIC_MANAGER_PORT):
+    """Spawns up to count autopilot vehicles in one batch, returns their actor ids."""
+    blueprints = [bp for bp in world.get_blueprint_library().filter('vehicle.*')
+                  if int(bp.get_attribute('number_of_wheels')) == 4]
+    spawn_points = world.get_map().get_spawn_points()
+    random.shuffle(spawn_points)
+    batch = [carla.command.SpawnActor(random.choice(blueprints), transform)
+             .then(carla.command.SetAutopilot(carla.command.FutureActor, True, tm_port))
+             for transform in spawn_points[:count]]
+    actor_ids = []
+    for response in client.apply_batch_sync(batch, True):
+        if response.error:
+            print(f"Fleet vehicle not spawned: {response.error}")
+        else:
+            actor_ids.append(response.actor_id)
+    return actor_ids
+
+def fleet_speeds(snapshot, actor_ids):
+    # Every fleet vehicle's speed from one world snapshot instead of an RPC per actor,
+    # vehicles destroyed since are left out
+    speeds = {}
+    for actor_id in actor_ids:
+        actor = snapshot.find(actor_id)
+        if actor is not None:
+            speeds[actor_id] = speed_kph(actor.get_velocity())
+    return speeds
+
+def quit_requested():
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            return True
+        elif event.type == pygame.KEYDOWN:
+            if event.key == K_ESCAPE or event.key == K_q:
+                return True
+    return False
 
 def run_simulation(args, client):
     """This function performed one test run using the args parameters
@@ -242,8 +370,11 @@ def run_simulation(args, client):
     vehicle = None
     vehicle_list = []
     timer = CustomTimer()
-    udpserver = UDP_Server.Server()
-    udpserver.start()
+    udpserver = make_telemetry(args)
+    udpserver.start()  # subscribers join and expire in the background
+    recorder = Frame_Recorder.FrameRecorder(args.record) if args.record else None
+    profiler = make_profiler(args)
+    pipeline = None
 
     try:
         # Getting the world and
@@ -252,11 +383,11 @@ def run_simulation(args, client):
         original_settings = world.get_settings()
 
         if args.sync:
-            traffic_manager = client.get_trafficmanager(8000)
+            traffic_manager = client.get_trafficmanager(TRAFFIC_MANAGER_PORT)
             settings = world.get_settings()
             traffic_manager.set_synchronous_mode(True)
             settings.synchronous_mode = True
-            settings.fixed_delta_seconds = 0.05
+            settings.fixed_delta_seconds = FIXED_DELTA_SECONDS
             world.apply_settings(settings)
 
 
@@ -276,63 +407,200 @@ def run_simulation(args, client):
 
         vehicle.set_light_state(light_state)  # Apply the light state
 
+        # Fleet mode: the ego vehicle plus spawned and/or already present vehicles,
+        # each published as its own id-tagged telemetry stream
+        fleet_ids = []
+        if args.fleet or args.fleet_attach:
+            fleet_ids.append(vehicle.id)
+            if args.fleet_attach:
+                fleet_ids += [actor.id for actor in world.get_actors().filter('vehicle.*') if actor.id != vehicle.id]
+            if args.fleet:
+                spawned = spawn_fleet(client, world, args.fleet)
+                vehicle_list += spawned
+                fleet_ids += spawned
+            print(f"Fleet: {len(fleet_ids)} vehicles, ids {fleet_ids}")
+
         # Display Manager organize all the sensors an its display in a window
         # If can easily configure the grid and the total window size
-        display_manager = DisplayManager(grid_size=[1, 1], window_size=[args.width, args.height])
+        rig = load_cameras(args.cameras)
+        display_manager = DisplayManager(grid_size=rig['grid'], window_size=[args.width, args.height])
 
         # Then, SensorManager can be used to spawn RGBCamera, LiDARs and SemanticLiDARs as needed
-        # and assign each of them to a grid position, 
-        SensorManager(world, display_manager, 'RGBCamera', carla.Transform(carla.Location(x=1.2, z=1.5), carla.Rotation(yaw=+00)), 
-                      vehicle, {}, display_pos=[0, 0])
+        # and assign each of them to a grid position, one lane processor per camera.
+        # Only the first camera is recorded, recordings hold a single frame per tick
+        cameras = []
+        for camera in rig['cameras']:
+            transform = carla.Transform(carla.Location(**camera.get('location', {})),
+                                        carla.Rotation(**camera.get('rotation', {})))
+            cameras.append(SensorManager(world, display_manager, 'RGBCamera', transform, vehicle,
+                                         camera.get('options', {}), display_pos=camera['pos'],
+                                         recorder=None if cameras else recorder, profiler=profiler,
+                                         **lane_options(args)))
 
 
         #Simulation loop
-        call_exit = False
         clock = pygame.time.Clock()
-        while True:
-            start_time = time.time()  # Record the start time of the loop
-            # Carla Tick
+        scheduler = Frame_Scheduler.FrameScheduler(profiler)
+        Speed = 0.0
+        State = None  # VehicleState of the latest tick, transform and control for signals beyond speed
+        Fleet = {}  # actor id -> km/h
+
+        def sample_snapshot(snapshot):
+            # Ego and fleet state straight from the tick's snapshot, no per-actor RPC
+            return vehicle_state(snapshot, vehicle), fleet_speeds(snapshot, fleet_ids)
+
+        def sample_tick(frame):
+            # world.get_snapshot() is the client's copy of the tick just received
+            return sample_snapshot(world.get_snapshot())
+
+        def apply_sample(state, fleet):
+            nonlocal Speed, State, Fleet
+            if state is not None:
+                State = state
+                Speed = speed_kph(state.velocity)
+                if recorder is not None:
+                    recorder.add_tick(state.frame, state.timestamp, state.velocity)
+            Fleet = fleet
+
+        if args.sync and args.pipeline_depth:
+            pipeline = Frame_Scheduler.TickPipeline(world.tick, sample_tick, depth=args.pipeline_depth)
+
+        def pipelined_sim_step():
+            # Tick N+1 is already simulating while frame N finishes here
+            t = time.perf_counter()
+            frame, (state, fleet) = pipeline.next()
+            if profiler:
+                t = profiler.lap('loop.tick', t)
+            for camera in cameras:
+                if not camera.wait_for_frame(frame):
+                    print(f"Frame {frame}: no camera result, continuing")
+            if profiler:
+                profiler.lap('loop.frame_wait', t)
+            apply_sample(state, fleet)
+            pipeline.done()
+
+        def sim_step():
+            t = time.perf_counter()
+            # Carla Tick, the snapshot it delivers holds every actor's state
             if args.sync:
                 world.tick()
+                snapshot = world.get_snapshot()
             else:
-                world.wait_for_tick()
+                snapshot = world.wait_for_tick()
+            if profiler:
+                t = profiler.lap('loop.tick', t)
+            apply_sample(*sample_snapshot(snapshot))
+            if profiler:
+                profiler.lap('loop.sample', t)
+
+        def telemetry_step():
+            t = time.perf_counter()
+            udpserver.send_data(speed=Speed)
+            for actor_id, speed in Fleet.items():
+                udpserver.send_data(speed=speed, vehicle_id=actor_id)
+            if profiler:
+                profiler.lap('loop.send_data', t)
 
+        def render_step():
             # Render received data
+            t = time.perf_counter()
             display_manager.render()
-            v = vehicle.get_velocity()
-            Speed = int(3.6 * math.sqrt(v.x**2 + v.y**2 + v.z**2))
-            udpserver.send_data(speed=Speed)
+            if profiler:
+                t = profiler.lap('loop.render', t)
+            clock.tick()
+            if quit_requested():
+                scheduler.stop()
+            if profiler:
+                profiler.lap('loop.events', t)
+
+        sim_rate = args.sim_rate or (1.0 / FIXED_DELTA_SECONDS)
+        scheduler.add('sim', sim_rate, pipelined_sim_step if pipeline else sim_step)
+        scheduler.add('telemetry', args.telemetry_rate or sim_rate, telemetry_step)
+        scheduler.add('render', args.render_rate, render_step)
+
+        next_stats_dump = time.time() + args.link_stats_interval
+        next_status = time.time() + STATUS_INTERVAL
+        while scheduler.running:
+            scheduler.run_once()
+            if args.link_stats and time.time() >= next_stats_dump:
+                udpserver.stats.dump(args.link_stats)
+                next_stats_dump += args.link_stats_interval
+            if profiler:
+                profiler.maybe_export()
+            if time.time() >= next_status:
+                print('Client:%16.0f FPS  Speed:%15.0f km/h' % (clock.get_fps(), Speed))
+                for camera in cameras:
+                    if camera.quality is not None:
+                        print(f"Lane quality {camera.display_pos}: {camera.quality_status()}")
+                next_status += STATUS_INTERVAL
+        print(f"Scheduler: {scheduler.summary()}")
 
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    call_exit = True
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == K_ESCAPE or event.key == K_q:
-                        call_exit = True
-                        break
+    finally:
+        if pipeline is not None:
+            pipeline.stop()
+        if display_manager:
+            display_manager.destroy()
 
-            if call_exit:
-                break
+        client.apply_batch([carla.command.DestroyActor(x) for x in vehicle_list])
+        world.apply_settings(original_settings)
+        udpserver.stop()
+        if recorder is not None:
+            recorder.close()
+        if profiler:
+            profiler.export()
 
-            # Measure the time taken for processing and rendering
-            processing_time = time.time() - start_time  # Time taken for processing this frame
-    
-            # Calculate the remaining time to maintain 20 FPS
-            time_to_sleep = max(0, 0.045 - processing_time)  # 50ms per frame (20 FPS)
-    
-            # Sleep to maintain 20 FPS
-            time.sleep(time_to_sleep)
-            clock.tick()
-            print('Client:%16.0f FPS  Speed:%15.0f km/h' % (clock.get_fps(), Speed))
 
+def run_replay(args):
+    """Replays a --record file through lane detection and telemetry, no CARLA needed.
+    """
+
+    source = Frame_Recorder.ReplaySource(args.replay)
+    display_manager = None
+    profiler = make_profiler(args)
+    udpserver = make_telemetry(args)
+    udpserver.start()
+
+    try:
+        display_manager = DisplayManager(grid_size=[1, 1], window_size=[source.width, source.height])
+        sensor = SensorManager(None, display_manager, 'Replay', None, None, {}, display_pos=[0, 0],
+                               profiler=profiler, **lane_options(args))
+
+        t_start = time.perf_counter()
+        ticks = 0
+        for image, v in source.play(realtime=not args.replay_max_speed, loop=args.replay_loop):
+            t = time.perf_counter()
+            if image is not None:
+                sensor.save_rgb_image(image)
+                if args.replay_max_speed:
+                    # Nothing paces the replay: wait for the lanes so every frame goes through detection
+                    if not sensor.wait_for_frame(image.frame):
+                        print(f"Frame {image.frame}: no lane result, continuing")
+            display_manager.render()
+            if profiler:
+                t = profiler.lap('loop.render', t)
+            udpserver.send_data(speed=speed_kph(v))
+            if profiler:
+                t = profiler.lap('loop.send_data', t)
+            ticks += 1
+            if quit_requested():
+                break
+            if profiler:
+                profiler.lap('loop.events', t)
+                profiler.maybe_export()
 
+        elapsed = time.perf_counter() - t_start
 
     finally:
         if display_manager:
             display_manager.destroy()
+        udpserver.stop()
+        if profiler:
+            profiler.export()
 
-        client.apply_batch([carla.command.DestroyActor(x) for x in vehicle_list])
-        world.apply_settings(original_settings)
+    # After destroy(): the processor has shut down and published its last frames
+    print('Replayed %d ticks in %.1f s (%.1f ticks/s), lane detection %.2f ms/frame' % (
+        ticks, elapsed, ticks / max(elapsed, 1e-9),
+        1000 * sensor.time_processing / max(sensor.tics_processing, 1)))
 
 
 
@@ -366,11 +634,165 @@ def main():
         #default='1280x720',
         default='800x600',
         help='window resolution (default: 1280x720)')
+    argparser.add_argument(
+        '--lane-workers',
+        metavar='N',
+        default=1,
+        type=int,
+        help='lane detection workers per camera, 0 runs it on the sensor callback (default: 1)')
+    argparser.add_argument(
+        '--lane-executor',
+        choices=Lane_Detection.FrameProcessor.EXECUTORS,
+        default='thread',
+        help='run lane detection on a thread pool, a process pool, or worker processes '
+             'fed through shared memory (default: thread)')
+    argparser.add_argument(
+        '--cameras',
+        metavar='FILE',
+        default=None,
+        help='JSON camera rig: grid, transforms and blueprint options per camera (default: one front camera)')
+    argparser.add_argument(
+        '--lane-tracking',
+        action='store_true',
+        help='track lanes across frames and only search around the previous fit')
+    argparser.add_argument(
+        '--lane-length-weighted',
+        action='store_true',
+        help='weight Hough segments by length when averaging a lane')
+    argparser.add_argument(
+        '--lane-scale',
+        metavar='S',
+        default=1.0,
+        type=float,
+        help='run lane detection on the ROI downscaled by S, e.g. 0.5 at 1920x1080 (default: 1.0)')
+    argparser.add_argument(
+        '--lane-budget',
+        metavar='MS',
+        default=None,
+        type=float,
+        help='per-frame lane detection budget: lower the processing scale and Hough work, then skip '
+             'frames, to stay within MS milliseconds per camera frame (default: off, full quality)')
+    argparser.add_argument(
+        '--record',
+        metavar='FILE',
+        default=None,
+        help='record the first camera frames and vehicle velocity to FILE')
+    argparser.add_argument(
+        '--replay',
+        metavar='FILE',
+        default=None,
+        help='replay a --record FILE instead of connecting to CARLA')
+    argparser.add_argument(
+        '--replay-max-speed',
+        action='store_true',
+        help='replay as fast as possible instead of in real time')
+    argparser.add_argument(
+        '--replay-loop',
+        action='store_true',
+        help='restart the replay when it reaches the end')
+    argparser.add_argument(
+        '--pipeline-depth',
+        metavar='N',
+        default=0,
+        type=int,
+        help='with --sync, tick up to N frames ahead while earlier frames are processed; '
+             'keep at or below --lane-workers so no frame is dropped (default: 0, off)')
+    argparser.add_argument(
+        '--sim-rate',
+        metavar='HZ',
+        default=None,
+        type=float,
+        help='simulation ticks per second (default: 1 / fixed_delta_seconds = %.0f)' % (1.0 / FIXED_DELTA_SECONDS))
+    argparser.add_argument(
+        '--render-rate',
+        metavar='HZ',
+        default=20.0,
+        type=float,
+        help='display refreshes per second (default: 20)')
+    argparser.add_argument(
+        '--telemetry-rate',
+        metavar='HZ',
+        default=None,
+        type=float,
+        help='UDP telemetry packets per second (default: same as --sim-rate)')
+    argparser.add_argument(
+        '--profile',
+        metavar='FILE',
+        default=None,
+        help='time loop and lane pipeline stages, append histograms as JSON lines to FILE')
+    argparser.add_argument(
+        '--profile-udp',
+        metavar='HOST:PORT',
+        default=None,
+        help='also send the stage histograms to a local UDP endpoint')
+    argparser.add_argument(
+        '--profile-interval',
+        metavar='S',
+        default=5.0,
+        type=float,
+        help='seconds between stage histogram exports (default: 5)')
+    argparser.add_argument(
+        '--telemetry',
+        choices=['udp', 'shm'],
+        default='udp',
+        help='telemetry transport, shm for a dashboard on the same host (default: udp)')
+    argparser.add_argument(
+        '--shm-name',
+        metavar='NAME',
+        default=SHM_Server.SHM_NAME,
+        help='shared memory block name with --telemetry shm (default: %(default)s)')
+    argparser.add_argument(
+        '--wire',
+        choices=[UDP_Server.WIRE_TEXT, UDP_Server.WIRE_BINARY, UDP_Server.WIRE_DELTA],
+        default=UDP_Server.WIRE_TEXT,
+        help='telemetry wire format, delta sends keyframes plus changed fields only (default: text)')
+    argparser.add_argument(
+        '--multicast',
+        metavar='GROUP',
+        default=None,
+        help='send telemetry to this multicast group instead of each subscriber')
+    argparser.add_argument(
+        '--multicast-port',
+        metavar='P',
+        default=UDP_Server.ServerBase.MULTICAST_PORT,
+        type=int,
+        help='destination port for the multicast group, clients bind it (default: %(default)s)')
+    argparser.add_argument(
+        '--link-stats',
+        metavar='FILE',
+        default=None,
+        help='append telemetry RTT/loss statistics as JSON lines to FILE')
+    argparser.add_argument(
+        '--link-stats-interval',
+        metavar='S',
+        default=5.0,
+        type=float,
+        help='seconds between link statistics dumps (default: 5)')
+    argparser.add_argument(
+        '--fleet',
+        metavar='N',
+        default=0,
+        type=int,
+        help='spawn N autopilot vehicles and stream telemetry for each of them and the ego vehicle, '
+             'tagged with the actor id (default: 0, off)')
+    argparser.add_argument(
+        '--fleet-attach',
+        action='store_true',
+        help='stream telemetry for every vehicle already in the world as well')
 
     args = argparser.parse_args()
+    if (args.fleet or args.fleet_attach) and args.telemetry == 'shm':
+        argparser.error('--fleet and --fleet-attach need --telemetry udp')
 
     args.width, args.height = [int(x) for x in args.res.split('x')]
 
+    if args.replay:
+        try:
+            run_replay(args)
+        except KeyboardInterrupt:
+            print('\nCancelled by user. Bye!')
+        return
+
     try:
         client = carla.Client(args.host, args.port)
         client.set_timeout(5.0)
@@ -0,0 +1,178 @@
+"""
+Record camera frames and vehicle velocity from a CARLA run and replay them
+without a CARLA server.
+
+File layout (little endian):
+    header  magic, version, width, height, channels
+    frames  raw BGRA images exactly as carla.Image.raw_data, back to back
+    index   one INDEX_DTYPE row per tick/frame, sorted by frame id
+    footer  index offset, index rows, magic
+
+The replay side memory-maps the file, so frames come back as read-only views
+into the page cache rather than copies.
+"""
+
+import collections
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+
+MAGIC = b"SDVREC\0\0"
+VERSION = 1
+HEADER = struct.Struct("<8sIIII")  # magic, version, width, height, channels
+FOOTER = struct.Struct("<QQ8s")  # index offset, index rows, magic
+INDEX_DTYPE = np.dtype([('frame', '<i8'), ('timestamp', '<f8'), ('velocity', '<f4', (3,)), ('offset', '<i8')])
+CHANNELS = 4  # BGRA
+
+Velocity = collections.namedtuple('Velocity', 'x y z')
+
+
+class FrameRecorder:
+
+    MAX_QUEUED = 64  # frames waiting for the writer before new ones are dropped
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(bytes(HEADER.size))  # filled in on close, size known after the first frame
+        self.lock = threading.Lock()
+        self.width = 0
+        self.height = 0
+        self.images = {}  # frame id -> (timestamp, offset)
+        self.ticks = []  # (frame id, timestamp, vx, vy, vz)
+        self.dropped = 0
+        # Frames are written on their own thread, the camera callback only queues the
+        # image, which keeps its buffer alive until written
+        self.queue = queue.Queue(self.MAX_QUEUED)
+        self.writer = threading.Thread(target=self.write_images, name='frame-recorder', daemon=True)
+        self.writer.start()
+
+    def add_image(self, image):
+        # Camera callback thread
+        with self.lock:
+            if self.file is None:
+                return
+            if not self.width:
+                self.width, self.height = image.width, image.height
+            elif (image.width, image.height) != (self.width, self.height):
+                raise ValueError("All recorded frames must have the same size")
+            try:
+                self.queue.put_nowait(image)
+            except queue.Full:
+                self.dropped += 1
+
+    def write_images(self):
+        while True:
+            image = self.queue.get()
+            if image is None:
+                break
+            offset = self.file.tell()
+            self.file.write(image.raw_data)
+            self.images[image.frame] = (image.timestamp, offset)
+
+    def add_tick(self, frame, timestamp, velocity):
+        with self.lock:
+            self.ticks.append((frame, timestamp, velocity.x, velocity.y, velocity.z))
+
+    def build_index(self):
+        frames = sorted(set(self.images) | {tick[0] for tick in self.ticks})
+        index = np.zeros(len(frames), dtype=INDEX_DTYPE)
+        index['frame'] = frames
+        index['offset'] = -1
+
+        # Images take the velocity of the latest tick at or before them
+        ticks = np.array(sorted(self.ticks), dtype=np.float64).reshape(-1, 5)
+        if len(ticks):
+            nearest = np.clip(np.searchsorted(ticks[:, 0], frames, side='right') - 1, 0, len(ticks) - 1)
+            index['timestamp'] = ticks[nearest, 1]
+            index['velocity'] = ticks[nearest, 2:]
+        for row, frame in enumerate(frames):
+            if frame in self.images:
+                index['timestamp'][row], index['offset'][row] = self.images[frame]
+        return index
+
+    def close(self):
+        with self.lock:
+            if self.file is None:
+                return
+            # add_image still holds the file open, so nothing is queued after the sentinel
+            self.queue.put(None)
+            self.writer.join()
+            index = self.build_index()
+            index_offset = self.file.tell()
+            self.file.write(index.tobytes())
+            self.file.write(FOOTER.pack(index_offset, len(index), MAGIC))
+            self.file.seek(0)
+            self.file.write(HEADER.pack(MAGIC, VERSION, self.width, self.height, CHANNELS))
+            self.file.close()
+            self.file = None
+        print(f"Recorded {len(self.images)} frames, {len(self.ticks)} ticks to {self.path}"
+              + (f", {self.dropped} frames dropped while the disk fell behind" if self.dropped else ""))
+
+
+class ReplayImage:
+    # Stand-in for carla.Image with the attributes SensorManager uses
+
+    def __init__(self, frame, timestamp, width, height, raw_data):
+        self.frame = frame
+        self.timestamp = timestamp
+        self.width = width
+        self.height = height
+        self.raw_data = raw_data
+
+    def convert(self, color_converter):
+        pass
+
+
+class ReplaySource:
+
+    def __init__(self, path):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, version, self.width, self.height, channels = HEADER.unpack_from(self.data)
+        index_offset, rows, footer_magic = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+        if magic != MAGIC or footer_magic != MAGIC or version != VERSION or channels != CHANNELS:
+            raise ValueError(f"{path} is not a complete version {VERSION} recording")
+        self.index = np.frombuffer(self.data, dtype=INDEX_DTYPE, count=rows, offset=index_offset)
+        self.frame_size = self.width * self.height * channels
+
+    def __len__(self):
+        return len(self.index)
+
+    def image(self, row, frame_offset=0):
+        entry = self.index[row]
+        offset = int(entry['offset'])
+        if offset < 0:
+            return None
+        raw_data = self.data[offset:offset + self.frame_size]
+        return ReplayImage(int(entry['frame']) + frame_offset, float(entry['timestamp']), self.width, self.height,
+                           raw_data)
+
+    def play(self, realtime=True, loop=False):
+        """
+        Yields (ReplayImage or None, Velocity) per recorded tick, paced by the
+        recorded simulation timestamps when realtime, otherwise as fast as the
+        consumer takes them. Frame ids keep increasing across loops, so each
+        pass is newer than the last to the lane pipeline. An empty recording
+        yields nothing, even with loop.
+        """
+        if not len(self.index):
+            return
+        span = int(self.index['frame'][-1]) - int(self.index['frame'][0]) + 1
+        frame_offset = 0
+        while True:
+            start = time.perf_counter()
+            t0 = float(self.index['timestamp'][0])
+            for row in range(len(self.index)):
+                if realtime:
+                    delay = start + (float(self.index['timestamp'][row]) - t0) - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                yield self.image(row, frame_offset), Velocity(*self.index['velocity'][row].tolist())
+            if not loop:
+                break
+            frame_offset += span
@@ -0,0 +1,132 @@
+"""
+Runs the simulation loop tasks at independent rates against absolute
+deadlines.
+
+Each task has a period and a deadline that advances by whole periods from
+the time the scheduler started, so sleeping and jitter never accumulate
+into drift. A task that is late by more than a period runs once and skips
+the deadlines it missed instead of trying to catch up, so an overrunning
+loop drops frames at a predictable rate rather than running slow.
+"""
+
+import math
+import queue
+import threading
+import time
+
+
+class Task:
+
+    def __init__(self, name, rate, fn):
+        if rate <= 0:
+            raise ValueError(f"{name} rate must be positive, got {rate}")
+        self.name = name
+        self.period = 1.0 / rate
+        self.fn = fn
+        self.deadline = 0.0
+        self.runs = 0
+        self.skipped = 0
+
+
+class FrameScheduler:
+
+    def __init__(self, profiler=None):
+        self.tasks = []
+        self.profiler = profiler
+        self.running = True
+        self.started = None
+
+    def add(self, name, rate, fn):
+        self.tasks.append(Task(name, rate, fn))
+
+    def stop(self):
+        self.running = False
+
+    def run_once(self):
+        """
+        Runs every task whose deadline has passed, in the order they were
+        added, then sleeps until the next deadline. Returns the tasks run.
+        """
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+            for task in self.tasks:
+                task.deadline = now
+
+        ran = []
+        for task in self.tasks:
+            if not self.running:
+                break
+            if now < task.deadline:
+                continue
+            missed = math.floor((now - task.deadline) / task.period)
+            task.skipped += missed
+            task.deadline += (missed + 1) * task.period
+            t_start = time.perf_counter()
+            task.fn()
+            task.runs += 1
+            ran.append(task)
+            now = time.perf_counter()
+            if self.profiler:
+                self.profiler.record('task.' + task.name, now - t_start)
+
+        if self.running:
+            delay = min(task.deadline for task in self.tasks) - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return ran
+
+    def summary(self):
+        return ', '.join(f"{task.name} {task.runs} run/{task.skipped} skipped" for task in self.tasks)
+
+
+class TickPipeline:
+    """
+    Issues synchronous-mode ticks from a background thread so the server
+    simulates tick N+1 while the client is still busy with frame N.
+
+    tick_fn advances the world and returns its frame id; sample_fn(frame)
+    reads whatever belongs to that tick (velocity, timestamp) before the next
+    tick is issued. The thread runs at most `depth` ticks ahead of the
+    consumer, which takes them in order with next() and hands the slot back
+    with done() once the frame is finished.
+    """
+
+    def __init__(self, tick_fn, sample_fn, depth=1):
+        if depth < 1:
+            raise ValueError(f"Pipeline depth must be at least 1, got {depth}")
+        self.tick_fn = tick_fn
+        self.sample_fn = sample_fn
+        self.slots = threading.Semaphore(depth + 1)  # the tick being consumed plus depth ahead
+        self.ticks = queue.Queue()
+        self.running = True
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name='tick-pipeline', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            while True:
+                self.slots.acquire()
+                if not self.running:
+                    break
+                frame = self.tick_fn()
+                self.ticks.put((frame, self.sample_fn(frame)))
+        except Exception as e:
+            self.error = e
+            self.ticks.put(None)
+
+    def next(self):
+        """(frame id, sample) of the oldest tick not yet consumed, blocks until issued."""
+        tick = self.ticks.get()
+        if tick is None:
+            raise RuntimeError("Tick pipeline stopped") from self.error
+        return tick
+
+    def done(self):
+        self.slots.release()
+
+    def stop(self):
+        self.running = False
+        self.slots.release()
+        self.thread.join(timeout=5.0)
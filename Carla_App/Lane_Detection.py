@@ -0,0 +1,638 @@
+"""
+Lane detection for the camera frames and the stage that runs it off the
+CARLA sensor callback thread.
+
+Nothing in here needs CARLA or pygame. Frames are (H, W, 4) BGRA arrays as
+delivered by carla.Image.raw_data (read-only views are fine) or (H, W, 3) RGB.
+"""
+
+import collections
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+
+class LaneDetector:
+
+    # Search region as fractions of the frame, matching the original
+    # (0,520),(800,520),(400,300) triangle at the default 800x600
+    ROI_TOP = 0.5
+    ROI_BOTTOM = 520 / 600
+    BAND_WIDTH = 0.05  # fraction of the width searched either side of a tracked lane
+    REFERENCE_HEIGHT = 600  # Hough parameters below are in pixels at this height
+
+    def __init__(self, length_weighted=False, scale=1.0):
+        # Weight each Hough segment by its length when averaging a lane
+        self.length_weighted = length_weighted
+        # Canny/Hough run on the ROI downscaled by this factor, lines are mapped back
+        self.scale = scale
+        self.hough_threshold = 50
+        self.hough_min_length = 10
+        self.hough_max_gap = 5
+        self.roi_cache = {}
+        self.profiler = None  # Stage_Profiler.StageProfiler, per-stage timings when set
+
+    def __getstate__(self):
+        # Process pool workers get a copy without the profiler (lock and socket do not pickle)
+        state = dict(self.__dict__)
+        state['profiler'] = None
+        return state
+
+    def tuned(self, scale, hough_threshold, hough_max_gap):
+        # Copy with other processing parameters and its own ROI cache, sharing the profiler
+        detector = LaneDetector(self.length_weighted, scale)
+        detector.hough_threshold = hough_threshold
+        detector.hough_min_length = self.hough_min_length
+        detector.hough_max_gap = hough_max_gap
+        detector.profiler = self.profiler
+        return detector
+
+    def make_coordinates(self, image, line_parameter):
+        slope, intercept = line_parameter
+        y1 = image.shape[0]
+        y2 = int(y1 * (3 / 5))
+        x1 = int((y1 - intercept) / slope)
+        x2 = int((y2 - intercept) / slope)
+        return np.array([x1, y1, x2, y2])
+
+    def roi_for(self, shape):
+        # ((x0, y0, x1, y1) crop, mask at processing scale), built once per resolution and scale
+        key = (shape[0], shape[1], self.scale)
+        roi = self.roi_cache.get(key)
+        if roi is None:
+            height, width = shape[:2]
+            y0 = int(height * self.ROI_TOP)
+            y1 = int(height * self.ROI_BOTTOM)
+            size = self.processing_size(width, y1 - y0)
+            mask = np.zeros((size[1], size[0]), dtype=np.uint8)
+            polygons = np.array([[(0, size[1]), (size[0], size[1]), (size[0] // 2, 0)]], dtype=np.int32)
+            cv2.fillPoly(mask, polygons, 255)
+            roi = self.roi_cache[key] = ((0, y0, width, y1), mask)
+        return roi
+
+    def processing_size(self, width, height):
+        return max(1, round(width * self.scale)), max(1, round(height * self.scale))
+
+    def band_region(self, shape, prior):
+        # Quads around the predicted lanes, relative to their bounding box (x0, y0, x1, y1)
+        height, width = shape[:2]
+        y_top = int(height * self.ROI_TOP)
+        y_bottom = int(height * self.ROI_BOTTOM)
+        band = self.BAND_WIDTH * width
+        polygons = []
+        for slope, intercept in prior.values():
+            x_top = (y_top - intercept) / slope
+            x_bottom = (y_bottom - intercept) / slope
+            polygons.append([(x_bottom - band, y_bottom), (x_bottom + band, y_bottom),
+                             (x_top + band, y_top), (x_top - band, y_top)])
+        polygons = np.array(polygons)
+        x0 = int(np.clip(polygons[:, :, 0].min(), 0, width - 1))
+        x1 = int(np.clip(polygons[:, :, 0].max(), x0 + 1, width))
+        return polygons - (x0, y_top), (x0, y_top, x1, y_bottom)
+
+    def find_lanes(self, image, prior=None):
+        """
+        Returns {'left': (slope, intercept) or None, 'right': ...} in full frame
+        coordinates. With a prior from LaneTracker only narrow bands around the
+        predicted lanes are run through Canny and Hough.
+        """
+        if prior is None:
+            (x0, y0, x1, y1), mask = self.roi_for(image.shape)
+        else:
+            polygons, (x0, y0, x1, y1) = self.band_region(image.shape, prior)
+            mask = None
+        region = image[y0:y1, x0:x1]
+        scale = self.scale
+        profiler = self.profiler
+        if profiler:
+            t = time.perf_counter()
+
+        #Canny function
+        gray = cv2.cvtColor(region, cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_RGB2GRAY)
+        if profiler:
+            t = profiler.lap('lane.cvtColor', t)
+        if scale != 1.0:
+            gray = cv2.resize(gray, self.processing_size(x1 - x0, y1 - y0), interpolation=cv2.INTER_AREA)
+            if profiler:
+                t = profiler.lap('lane.resize', t)
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        if profiler:
+            t = profiler.lap('lane.blur', t)
+        Canny_img = cv2.Canny(blurred, 50, 150)
+        if profiler:
+            t = profiler.lap('lane.canny', t)
+
+        #Region of interest
+        if mask is None:
+            mask = np.zeros_like(Canny_img)
+            cv2.fillPoly(mask, (polygons * scale).astype(np.int32), 255)
+        masked_image = cv2.bitwise_and(Canny_img, mask)
+        if profiler:
+            t = profiler.lap('lane.roi', t)
+
+        #Step 10: Apply Hough Line Transform to detect straight lines in the ROI
+        # Pixel parameters follow the processed frame height relative to REFERENCE_HEIGHT
+        f = image.shape[0] * scale / self.REFERENCE_HEIGHT
+        lines = cv2.HoughLinesP(masked_image, 2, np.pi / 180, threshold=max(10, round(self.hough_threshold * f)),
+                                minLineLength=max(2, round(self.hough_min_length * f)),
+                                maxLineGap=max(1, round(self.hough_max_gap * f)))
+        if profiler:
+            t = profiler.lap('lane.hough', t)
+
+        lanes = {'left': None, 'right': None}
+        if lines is None:
+            return lanes
+
+        # Classify and fit every segment at once instead of a polyfit per segment
+        x1, y1, x2, y2 = (lines.reshape(-1, 4) / scale + (x0, y0, x0, y0)).T
+        dx = x2 - x1
+        dy = y2 - y1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = dy / dx  # vertical segments give inf/nan and fall outside both ranges
+        intercepts = y1 - slopes * x1
+        weights = np.hypot(dx, dy) if self.length_weighted else None
+
+        right = (slopes > 0.5) & (slopes < 1.5)
+        left = (slopes < -0.5) & (slopes > -1.5)
+        lanes['left'] = self.average_fit(slopes, intercepts, left, weights, -1.0, -0.7)
+        lanes['right'] = self.average_fit(slopes, intercepts, right, weights, 0.7, 1.0)
+        if profiler:
+            profiler.lap('lane.fit', t)
+        return lanes
+
+    def average_fit(self, slopes, intercepts, selected, weights, min_slope, max_slope):
+        # Mean (slope, intercept) of the selected segments, None unless the slope is in range
+        if not selected.any():
+            return None
+        w = None if weights is None else weights[selected]
+        slope = np.average(slopes[selected], weights=w)
+        if not min_slope < slope < max_slope:
+            return None
+        return float(slope), float(np.average(intercepts[selected], weights=w))
+
+    def draw_lanes(self, lane_image, lanes):
+        # Blue in either channel order
+        color = (255, 0, 0, 255) if lane_image.shape[2] == 4 else (0, 0, 255)
+        for line_parameter in lanes.values():
+            if line_parameter is not None:
+                x1, y1, x2, y2 = self.make_coordinates(lane_image, line_parameter)
+                cv2.line(lane_image, (x1, y1), (x2, y2), color, 3)
+
+    def detect_road_lanes(self, image):
+        lane_image = np.copy(image)
+        self.draw_lanes(lane_image, self.find_lanes(image))
+        return lane_image
+
+
+# One QualityController level: processing scale and Hough parameters relative to the
+# configured detector, and the detection interval in frames (1: every frame)
+QualityLevel = collections.namedtuple('QualityLevel', ['scale', 'interval', 'hough_threshold', 'hough_max_gap'])
+
+
+class QualityController:
+    """
+    Holds lane detection to a per-frame time budget by stepping through
+    quality levels, from the configured detector (level 0) down to a smaller
+    processing scale, a higher Hough threshold and shorter maxLineGap (fewer
+    segments to vote, merge and fit), and finally detecting only every
+    second or third frame while the others reuse the last lanes.
+
+    Each level has its own tuned LaneDetector, built up front, so a level
+    change never touches a detector a worker is using. FrameProcessor asks
+    for the current level per frame and reports each frame's processing
+    time; the smoothed time per frame (detection time over the interval) is
+    compared with the budget. The controller steps down after DOWN_HOLD
+    frames over budget and back up only after UP_HOLD frames well below it
+    (HEADROOM), so it settles instead of oscillating between two levels.
+    """
+
+    LEVELS = (
+        QualityLevel(1.0, 1, 1.0, 1.0),
+        QualityLevel(0.75, 1, 1.0, 1.0),
+        QualityLevel(0.5, 1, 1.2, 0.8),
+        QualityLevel(0.5, 2, 1.2, 0.8),
+        QualityLevel(0.35, 2, 1.5, 0.6),
+        QualityLevel(0.35, 3, 1.5, 0.6),
+    )
+    SMOOTHING = 0.2  # weight of the newest frame in the moving average
+    HEADROOM = 0.5  # step up while below this share of the budget
+    DOWN_HOLD = 5  # frames measured at a level before stepping down
+    UP_HOLD = 50  # frames measured at a level before stepping up
+
+    def __init__(self, detector, budget, levels=LEVELS):
+        if budget <= 0:
+            raise ValueError(f"Frame time budget must be positive, got {budget}")
+        self.budget = budget
+        self.levels = levels
+        self.detectors = [detector.tuned(detector.scale * level.scale,
+                                         max(1, round(detector.hough_threshold * level.hough_threshold)),
+                                         max(1, round(detector.hough_max_gap * level.hough_max_gap)))
+                          for level in levels]
+        self.lock = threading.Lock()
+        self.level = 0
+        self.average = None  # seconds per detected frame at the current level
+        self.measured = 0
+        self.frames = 0
+        self.changes = 0
+
+    def current(self):
+        """(level, detector) for the next frame to detect."""
+        level = self.level
+        return level, self.detectors[level]
+
+    def admit(self):
+        # False for the frames the current level skips
+        with self.lock:
+            self.frames += 1
+            return self.frames % self.levels[self.level].interval == 0
+
+    def observe(self, level, elapsed):
+        with self.lock:
+            if level != self.level:
+                return  # dispatched before the last change
+            self.average = elapsed if self.average is None else self.average + self.SMOOTHING * (elapsed - self.average)
+            self.measured += 1
+            cost = self.average / self.levels[level].interval
+            if cost > self.budget and self.measured >= self.DOWN_HOLD and level < len(self.levels) - 1:
+                self.set_level(level + 1)
+            elif cost < self.HEADROOM * self.budget and self.measured >= self.UP_HOLD and level > 0:
+                self.set_level(level - 1)
+
+    def set_level(self, level):
+        # With the lock held
+        self.level = level
+        self.average = None
+        self.measured = 0
+        self.changes += 1
+
+    def status(self):
+        level = self.level
+        detector = self.detectors[level]
+        average = self.average
+        return {
+            'level': level,
+            'levels': len(self.levels),
+            'scale': detector.scale,
+            'interval': self.levels[level].interval,
+            'hough_threshold': detector.hough_threshold,
+            'hough_max_gap': detector.hough_max_gap,
+            'frame_ms': None if average is None else round(1000 * average / self.levels[level].interval, 2),
+            'budget_ms': round(1000 * self.budget, 2),
+            'changes': self.changes,
+        }
+
+
+class LaneTracker:
+    """
+    Per-lane state across frames: slope and intercept smoothed with an EMA.
+
+    predict() gives the prior for LaneDetector.find_lanes while both lanes are
+    tracked and None (full detection) once either has been missed for more
+    than max_misses frames in a row.
+    """
+
+    def __init__(self, alpha=0.3, max_misses=5):
+        self.alpha = alpha
+        self.max_misses = max_misses
+        self.lanes = {'left': None, 'right': None}
+        self.misses = {'left': 0, 'right': 0}
+
+    def predict(self):
+        if any(lane is None for lane in self.lanes.values()):
+            return None
+        return dict(self.lanes)
+
+    def update(self, measured):
+        for side, lane in measured.items():
+            if lane is not None:
+                state = self.lanes[side]
+                if state is None:
+                    self.lanes[side] = lane
+                else:
+                    self.lanes[side] = tuple(s + self.alpha * (m - s) for s, m in zip(state, lane))
+                self.misses[side] = 0
+            elif self.lanes[side] is not None:
+                self.misses[side] += 1
+                if self.misses[side] > self.max_misses:
+                    self.lanes[side] = None
+        return dict(self.lanes)
+
+
+# Per-process detectors (one per quality level) for the process pool, set once by the pool initializer
+_worker_detectors = None
+
+def _init_worker(detectors):
+    global _worker_detectors
+    _worker_detectors = detectors
+
+def _timed_find_lanes(detector, frame, prior):
+    # (lanes, seconds) timed where the detection runs, without pool startup or IPC
+    t_start = time.perf_counter()
+    lanes = detector.find_lanes(frame, prior)
+    return lanes, time.perf_counter() - t_start
+
+def _detect_in_worker(frame, prior, level=0):
+    return _timed_find_lanes(_worker_detectors[level], frame, prior)
+
+
+# Lanes in shared memory: one (valid, slope, intercept) row per side
+LANE_SIDES = ('left', 'right')
+
+def _write_lanes(rows, lanes):
+    for row, side in zip(rows, LANE_SIDES):
+        lane = None if lanes is None else lanes.get(side)
+        row[:] = (0.0, 0.0, 0.0) if lane is None else (1.0, lane[0], lane[1])
+
+def _read_lanes(rows):
+    return {side: (float(row[1]), float(row[2])) if row[0] else None for row, side in zip(rows, LANE_SIDES)}
+
+def _shm_views(buf, shape, slots):
+    # frames, priors and results laid out back to back in one block
+    frames = np.ndarray((slots,) + shape, dtype=np.uint8, buffer=buf)
+    lanes = np.ndarray((2, slots, len(LANE_SIDES), 3), dtype=np.float64, buffer=buf, offset=frames.nbytes)
+    return frames, lanes[0], lanes[1]
+
+def _shm_worker(detectors, name, shape, slots, requests, results):
+    block = shared_memory.SharedMemory(name=name)
+    frames, priors, found = _shm_views(block.buf, shape, slots)
+    try:
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            slot, level = request
+            prior = _read_lanes(priors[slot])
+            prior = prior if all(prior.values()) else None
+            try:
+                lanes, seconds = _timed_find_lanes(detectors[level], frames[slot], prior)
+                _write_lanes(found[slot], lanes)
+                results.put((slot, None, seconds))
+            except Exception as e:
+                results.put((slot, repr(e), None))
+    finally:
+        del frames, priors, found
+        block.close()
+
+
+class SharedMemoryExecutor:
+    """
+    Dedicated worker processes fed through a ring of frame slots in one
+    multiprocessing.shared_memory block.
+
+    The frame is copied once into a free slot, the prior and the found lanes
+    live next to it, and only slot numbers cross the process boundary, so no
+    frame is ever pickled. The block is sized by the first frame; every later
+    frame must have the same shape. submit() returns a Future of (lanes,
+    detection seconds), like the concurrent.futures pools it stands in for. Workers get every detector
+    (one per quality level) up front and are told the level per frame.
+    """
+
+    def __init__(self, detectors, workers=1):
+        self.detectors = detectors
+        self.workers = workers
+        self.context = multiprocessing.get_context('spawn')
+        self.block = None
+        self.shape = None
+        self.processes = []
+        self.lock = threading.Lock()
+        self.free = list(range(workers))
+        self.futures = {}  # slot -> Future
+        self.closed = False
+
+    def start(self, shape):
+        self.shape = shape
+        size = self.workers * (int(np.prod(shape)) + 2 * len(LANE_SIDES) * 3 * 8)
+        self.block = shared_memory.SharedMemory(create=True, size=size)
+        self.frames, self.priors, self.found = _shm_views(self.block.buf, shape, self.workers)
+        self.requests = self.context.Queue()
+        self.results = self.context.Queue()
+        for _ in range(self.workers):
+            process = self.context.Process(target=_shm_worker, daemon=True,
+                                           args=(self.detectors, self.block.name, shape, self.workers,
+                                                 self.requests, self.results))
+            process.start()
+            self.processes.append(process)
+        self.listener = threading.Thread(target=self.collect, name='lane-shm', daemon=True)
+        self.listener.start()
+
+    def submit(self, frame, prior, level=0):
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            if self.block is None:
+                self.start(frame.shape)
+            if frame.shape != self.shape:
+                future.set_exception(ValueError(f"Frame shape {frame.shape} != {self.shape}"))
+                return future
+            if not self.free:
+                raise RuntimeError("More frames submitted than shared memory slots")
+            slot = self.free.pop()
+            self.futures[slot] = future
+        np.copyto(self.frames[slot], frame)
+        _write_lanes(self.priors[slot], prior)
+        self.requests.put((slot, level))
+        return future
+
+    def collect(self):
+        while True:
+            message = self.results.get()
+            if message is None:
+                break
+            slot, error, seconds = message
+            lanes = _read_lanes(self.found[slot]) if error is None else None
+            with self.lock:
+                future = self.futures.pop(slot, None)
+                self.free.append(slot)
+            if future is None:
+                continue  # cancelled on shutdown
+            if error is None:
+                future.set_result((lanes, seconds))
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        futures = {}
+        with self.lock:
+            self.closed = True
+            if self.block is None:
+                return
+            if cancel_futures:
+                futures, self.futures = self.futures, {}
+        # Outside the lock: cancel() runs the done callbacks on this thread
+        for future in futures.values():
+            future.cancel()
+        for _ in self.processes:
+            self.requests.put(None)
+        for process in self.processes:
+            process.join(timeout=5.0 if wait else 0)
+        self.results.put(None)
+        self.listener.join()
+        del self.frames, self.priors, self.found
+        self.block.close()
+        self.block.unlink()
+        self.block = None
+
+
+class FrameProcessor:
+    """
+    Runs lane detection on a thread or process pool, or on worker processes
+    fed through shared memory (SharedMemoryExecutor), latest frame wins.
+
+    At most `workers` frames are in flight. A frame arriving while all workers
+    are busy replaces the single pending slot, and a result older than the last
+    published one is dropped, so on_result(frame_id, frame, lanes, seconds)
+    only ever moves forward in frame id; it is called under the processor lock
+    and must stay short. Workers only read the frame, drawing the lanes is left
+    to on_result. workers=0 runs inline in the caller.
+
+    With a LaneTracker, each frame is searched around the lanes predicted when
+    it was dispatched, and the tracker is updated in frame order on publish;
+    on_result gets the smoothed lanes.
+
+    With a QualityController, each frame is detected at the controller's
+    current level, which gets the frame's detection time back, measured in
+    the worker so pool startup and queueing do not count against the level. A frame the
+    level skips is published with the last lanes and elapsed None when no
+    detection is in flight, and left out otherwise.
+    """
+
+    EXECUTORS = ('thread', 'process', 'shm')
+
+    def __init__(self, detector, on_result, workers=1, executor='thread', tracker=None, controller=None):
+        if executor not in self.EXECUTORS:
+            raise ValueError(f"Unknown executor: {executor}")
+        self.detector = detector
+        self.on_result = on_result
+        self.tracker = tracker
+        self.controller = controller
+        detectors = controller.detectors if controller is not None else [detector]
+        self.workers = workers
+        self.use_processes = executor == 'process'
+        self.use_shared_memory = executor == 'shm'
+        self.executor = None
+        if workers > 0 and self.use_shared_memory:
+            self.executor = SharedMemoryExecutor(detectors, workers)
+        elif workers > 0 and self.use_processes:
+            # spawn: never fork the CARLA client's threads into the workers
+            self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=_init_worker, initargs=(detectors,))
+        elif workers > 0:
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix='lane')
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.pending = None  # (frame_id, frame, source) waiting for a free worker
+        self.last_published = -1
+        self.last_lanes = {'left': None, 'right': None}
+        self.dropped = 0
+        self.skipped = 0
+        self.closing = False
+
+    def level(self):
+        if self.controller is None:
+            return 0, self.detector
+        return self.controller.current()
+
+    def submit(self, frame_id, frame, source=None):
+        # source (e.g. the carla.Image owning the buffer) is kept alive until published
+        if self.controller is not None and not self.controller.admit():
+            self.reuse(frame_id, frame)
+            return
+
+        if self.executor is None:
+            level, detector = self.level()
+            t_start = time.perf_counter()
+            lanes = detector.find_lanes(frame, self.predict())
+            elapsed = time.perf_counter() - t_start
+            if self.controller is not None:
+                self.controller.observe(level, elapsed)
+            self.publish(frame_id, frame, lanes, elapsed)
+            return
+
+        with self.lock:
+            if self.in_flight >= self.workers:
+                if self.pending is not None:
+                    self.dropped += 1
+                self.pending = (frame_id, frame, source)
+                return
+            self.in_flight += 1
+        self.dispatch(frame_id, frame, source)
+
+    def predict(self):
+        if self.tracker is None:
+            return None
+        with self.lock:
+            return self.tracker.predict()
+
+    def dispatch(self, frame_id, frame, source):
+        t_start = time.perf_counter()
+        prior = self.predict()
+        level, detector = self.level()
+        if self.use_shared_memory:
+            future = self.executor.submit(frame, prior, level)
+        elif self.use_processes:
+            future = self.executor.submit(_detect_in_worker, frame, prior, level)
+        else:
+            future = self.executor.submit(_timed_find_lanes, detector, frame, prior)
+        future.add_done_callback(lambda f: self.done(frame_id, frame, source, level, t_start, f))
+
+    def done(self, frame_id, frame, source, level, t_start, future):
+        elapsed = time.perf_counter() - t_start
+        if self.controller is not None and not future.cancelled() and future.exception() is None:
+            self.controller.observe(level, future.result()[1])
+        with self.lock:
+            job, self.pending = self.pending, None
+            if job is not None and self.closing:
+                job = None  # shutting down, the pending frame is not dispatched
+            if job is None:
+                self.in_flight -= 1
+
+        if not future.cancelled():
+            error = future.exception()
+            if error is not None:
+                print(f"Lane detection failed on frame {frame_id}: {error}")
+            else:
+                self.publish(frame_id, frame, future.result()[0], elapsed)
+
+        if job is not None:
+            try:
+                self.dispatch(*job)
+            except RuntimeError:
+                # Executor shut down while a frame was pending
+                with self.lock:
+                    self.in_flight -= 1
+
+    def publish(self, frame_id, frame, lanes, elapsed):
+        # Under the lock so concurrent workers cannot publish or track out of order
+        with self.lock:
+            if frame_id <= self.last_published:
+                self.dropped += 1
+                return
+            self.last_published = frame_id
+            if self.tracker is not None:
+                lanes = self.tracker.update(lanes)
+            self.last_lanes = lanes
+            self.on_result(frame_id, frame, lanes, elapsed)
+
+    def reuse(self, frame_id, frame):
+        # A frame the quality level skips: shown with the last lanes unless a detection
+        # in flight would publish a newer result, which a reused frame would make stale
+        with self.lock:
+            self.skipped += 1
+            if self.in_flight or frame_id <= self.last_published:
+                return
+            self.last_published = frame_id
+            self.on_result(frame_id, frame, self.last_lanes, None)
+
+    def shutdown(self):
+        with self.lock:
+            self.closing = True
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
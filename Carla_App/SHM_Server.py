@@ -0,0 +1,102 @@
+"""
+Same-host telemetry through a shared memory seqlock instead of UDP.
+
+ShmServer has the Server interface (start, stop, send_data, stats) and
+shares UDP_Server.TelemetryBase with it for the samples, but writes each
+sample into a small named multiprocessing.shared_memory block.
+Dashboard/SHM_Client.ShmClient reads the latest sample straight from the
+mapping: no socket, no syscall and no parsing per read, and no ACK back.
+The block holds one sample, the ego vehicle's: fleet streams need UDP.
+
+Block layout (little endian), keep in sync with Dashboard/SHM_Client.py:
+    header  magic, version, closed flag, seqlock counter
+    sample  seq, send time (epoch s), SPEED, RPM, TEMP, FUEL, GEAR
+    reader  last poll time (epoch s) written by the client, for wait_for_client
+
+The counter is odd while a sample is being written; readers retry until
+they see the same even value before and after copying the sample.
+"""
+
+import struct
+import time
+from multiprocessing import shared_memory
+
+from UDP_Server import TelemetryBase
+
+
+SHM_NAME = "sdv_telemetry"
+SHM_MAGIC = b"SV"
+SHM_VERSION = 1
+HEADER = struct.Struct("<2sBBI")  # magic, version, closed, seqlock counter
+CLOSED_OFFSET = 3
+COUNTER = struct.Struct("<I")
+COUNTER_OFFSET = 4
+SAMPLE = struct.Struct("<IdHHhBB")  # seq, send time, SPEED, RPM, TEMP, FUEL, GEAR
+READER = struct.Struct("<d")
+SAMPLE_OFFSET = HEADER.size
+READER_OFFSET = SAMPLE_OFFSET + SAMPLE.size
+SHM_SIZE = READER_OFFSET + READER.size
+
+
+class ShmServer(TelemetryBase):
+
+    POLL_INTERVAL = 0.05  # seconds between checks while waiting for a client
+    READER_TIMEOUT = 10  # seconds since the reader's last poll that still count as a client
+
+    def __init__(self, name=SHM_NAME):
+        super().__init__()
+        self.name = name
+        try:
+            self.block = shared_memory.SharedMemory(name=name, create=True, size=SHM_SIZE)
+        except FileExistsError:
+            # Left behind by a server that did not stop cleanly, take it over so
+            # readers still attached to it keep working; unlinked again on stop()
+            self.block = shared_memory.SharedMemory(name=name)
+            if self.block.size < SHM_SIZE:
+                raise ValueError(f"Shared memory block {name} is too small ({self.block.size} bytes)")
+        self.buf = self.block.buf
+        self.counter = COUNTER.unpack_from(self.buf, COUNTER_OFFSET)[0] & ~1
+        HEADER.pack_into(self.buf, 0, SHM_MAGIC, SHM_VERSION, 0, self.counter)
+        print(f"Server started at shared memory {name}")
+
+    def start(self, wait_for_client=False):
+        if wait_for_client:
+            print("Waiting for client...")
+            while not self.client_ready.is_set():
+                self.poll_reader()
+                time.sleep(self.POLL_INTERVAL)
+
+    def poll_reader(self):
+        last_poll = READER.unpack_from(self.buf, READER_OFFSET)[0]
+        if last_poll and time.time() - last_poll <= self.READER_TIMEOUT:
+            self.client_ready.set()
+            return True
+        return False
+
+    def stop(self):
+        if self.block is None:
+            return
+        # Tell attached readers to let go, then remove the name
+        self.buf[CLOSED_OFFSET] = 1
+        self.buf = None
+        self.block.close()
+        try:
+            self.block.unlink()
+        except FileNotFoundError:
+            pass
+        self.block = None
+
+    def send_data(self, speed, vehicle_id=None):
+        if vehicle_id is not None:
+            raise ValueError("ShmServer carries the ego vehicle only, fleet telemetry needs UDP")
+        seq, rpm, temperature, fuel, gear = self.next_sample(self.streams[None], speed)
+        if self.buf is None:
+            return
+        counter = self.counter
+        COUNTER.pack_into(self.buf, COUNTER_OFFSET, (counter + 1) & 0xFFFFFFFF)
+        SAMPLE.pack_into(self.buf, SAMPLE_OFFSET, seq, time.time(), int(speed), int(rpm),
+                         int(temperature), int(fuel), int(gear))
+        self.counter = (counter + 2) & 0xFFFFFFFF
+        COUNTER.pack_into(self.buf, COUNTER_OFFSET, self.counter)
+        self.poll_reader()
+        self.stats.add_sent(0)  # nothing is acknowledged over shared memory
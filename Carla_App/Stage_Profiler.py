@@ -0,0 +1,97 @@
+"""
+Opt-in timing of the simulation loop and lane pipeline stages.
+
+Durations go into per-stage histograms with quarter-octave buckets, so
+recording is a log2, a lock and an increment. Every `interval` seconds the
+histograms are exported as one JSON line to a file and/or a local UDP
+endpoint and reset, giving count, mean and p50/p90/p99/max per stage for
+that interval.
+"""
+
+import json
+import math
+import socket
+import threading
+import time
+
+
+class StageProfiler:
+
+    BUCKETS_PER_OCTAVE = 4
+    MIN_SECONDS = 1e-6  # everything faster lands in bucket 0
+    NUM_BUCKETS = 100  # 1 us .. ~30 s
+
+    def __init__(self, path=None, udp_addr=None, interval=5.0):
+        self.path = path
+        self.udp_addr = udp_addr
+        self.interval = interval
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if udp_addr else None
+        self.lock = threading.Lock()
+        self.stages = {}  # name -> [counts per bucket, count, total, max]
+        self.next_export = time.perf_counter() + interval
+
+    def record(self, name, seconds):
+        bucket = 0
+        if seconds > self.MIN_SECONDS:
+            bucket = min(self.NUM_BUCKETS - 1, int(math.log2(seconds / self.MIN_SECONDS) * self.BUCKETS_PER_OCTAVE))
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = [[0] * self.NUM_BUCKETS, 0, 0.0, 0.0]
+            stage[0][bucket] += 1
+            stage[1] += 1
+            stage[2] += seconds
+            if seconds > stage[3]:
+                stage[3] = seconds
+
+    def lap(self, name, t_start):
+        # Records the time since t_start and returns now, for back to back stages
+        now = time.perf_counter()
+        self.record(name, now - t_start)
+        return now
+
+    def bucket_upper(self, bucket):
+        return self.MIN_SECONDS * 2 ** ((bucket + 1) / self.BUCKETS_PER_OCTAVE)
+
+    def percentile(self, counts, total, q):
+        target = q * total
+        seen = 0
+        for bucket, count in enumerate(counts):
+            seen += count
+            if seen >= target:
+                return self.bucket_upper(bucket)
+        return self.bucket_upper(self.NUM_BUCKETS - 1)
+
+    def snapshot(self, reset=True):
+        with self.lock:
+            stages, self.stages = self.stages, ({} if reset else self.stages)
+        summary = {}
+        for name, (counts, count, total, longest) in sorted(stages.items()):
+            summary[name] = {
+                'count': count,
+                'mean_ms': round(1000 * total / count, 3),
+                'p50_ms': round(1000 * min(self.percentile(counts, count, 0.50), longest), 3),
+                'p90_ms': round(1000 * min(self.percentile(counts, count, 0.90), longest), 3),
+                'p99_ms': round(1000 * min(self.percentile(counts, count, 0.99), longest), 3),
+                'max_ms': round(1000 * longest, 3),
+            }
+        return summary
+
+    def maybe_export(self):
+        # Called once per loop iteration, exports when the interval is up
+        now = time.perf_counter()
+        if now < self.next_export:
+            return
+        self.next_export = now + self.interval
+        self.export()
+
+    def export(self):
+        line = json.dumps({'time': time.time(), 'interval_s': self.interval, 'stages': self.snapshot()})
+        if self.path:
+            with open(self.path, 'a') as f:
+                f.write(line + "\n")
+        if self.sock is not None:
+            try:
+                self.sock.sendto(line.encode(), self.udp_addr)
+            except OSError as e:
+                print(f"Profile export to {self.udp_addr} failed: {e}")
@@ -1,9 +1,113 @@
+import asyncio
+import collections
+import json
 import socket
 import random
+import struct
+import threading
 import time
 import math
 
 
+# Wire formats understood by UDP_Client.Client
+WIRE_TEXT = "text"        # "SPEED:..,RPM:..,TEMP:..,FUEL:..,GEAR:.." (legacy)
+WIRE_BINARY = "binary"    # fixed-layout little-endian frame, see FRAME below
+WIRE_DELTA = "delta"      # binary keyframes plus deltas holding only the changed fields
+
+# Binary frame: schema header followed by one sample record.
+# Keep in sync with the layout in Dashboard/UDP_Client.py
+WIRE_MAGIC = b"SV"
+WIRE_VERSION = 2
+FRAME_SAMPLE = 1  # keyframe: every field
+FRAME_DELTA = 2   # header, changed-field bitmask (bit i = SAMPLE_FIELDS[i]), then those fields in order
+FRAME_TAGGED = 0x80  # frame type flag: a vehicle id (TAG) follows the header, fleet streams
+HEADER = struct.Struct("<2sBBBId")  # magic, version, frame type, field count, seq, send time (epoch s)
+TAG = struct.Struct("<I")  # vehicle id (CARLA actor id)
+SAMPLE = struct.Struct("<HHhBB")   # SPEED, RPM, TEMP, FUEL, GEAR
+SAMPLE_FIELDS = ("SPEED", "RPM", "TEMP", "FUEL", "GEAR")
+FRAME = struct.Struct(HEADER.format + SAMPLE.format[1:])
+TAGGED_FRAME = struct.Struct(HEADER.format + TAG.format[1:] + SAMPLE.format[1:])
+# Delta body per changed-field mask: the mask byte, then the changed fields in order
+DELTA_BODIES = tuple(struct.Struct("<B" + "".join(code for i, code in enumerate(SAMPLE.format[1:]) if mask & (1 << i)))
+                     for mask in range(1 << len(SAMPLE_FIELDS)))
+
+# Subscriptions: READY alone is the untagged stream of the ego vehicle, READY:<id> one
+# fleet vehicle's tagged stream and READY:* every fleet vehicle's. A ;NOACK suffix marks
+# a subscriber that never ACKs, it is left out of the expected ACKs
+FLEET_ALL = "*"
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class AckStats():
+    # Rolling link statistics on the server side, fed from the subscribers' ACKs
+
+    WINDOW = 1024  # RTT samples kept for percentiles
+
+    def __init__(self):
+        self.rtts = collections.deque(maxlen=self.WINDOW)
+        self.sent = 0
+        self.expected_acks = 0
+        self.acks = 0
+        self.reordered = 0
+        # Reordering and jitter compare ACKs of one subscriber on one stream,
+        # keyed (addr, vehicle id): sequence numbers are per vehicle
+        self.highest_acked = {}
+        self.last_rtt = {}
+        self.jitter = 0.0
+
+    def add_sent(self, targets):
+        self.sent += 1
+        self.expected_acks += targets
+
+    def add_ack(self, seq, rtt, addr=None, vehicle_id=None, coalesced=0):
+        # coalesced: superseded datagrams the subscriber skipped, covered by this ACK
+        self.acks += 1 + coalesced
+        self.rtts.append(rtt)
+        key = (addr, vehicle_id)
+        if seq < self.highest_acked.get(key, -1):
+            self.reordered += 1
+        else:
+            self.highest_acked[key] = seq
+        # RFC 3550 style smoothed jitter on consecutive RTTs of the same subscriber
+        last_rtt = self.last_rtt.get(key)
+        if last_rtt is not None:
+            self.jitter += (abs(rtt - last_rtt) - self.jitter) / 16
+        self.last_rtt[key] = rtt
+
+    def forget(self, addr):
+        # Drops a subscriber's per-stream state once it left or expired
+        for key in [key for key in self.last_rtt if key[0] == addr]:
+            self.highest_acked.pop(key, None)
+            del self.last_rtt[key]
+
+    def snapshot(self):
+        rtts = sorted(self.rtts)
+        to_ms = lambda v: None if v is None else round(v * 1000, 3)
+        return {
+            'sent': self.sent,
+            'acks': self.acks,
+            'ack_loss': round(1 - self.acks / self.expected_acks, 4) if self.expected_acks else 0.0,
+            'reordered': self.reordered,
+            'rtt_p50_ms': to_ms(percentile(rtts, 0.50)),
+            'rtt_p99_ms': to_ms(percentile(rtts, 0.99)),
+            'rtt_jitter_ms': to_ms(self.jitter),
+        }
+
+    def dump(self, path=None):
+        # One JSON line per call, appended to path or printed
+        line = json.dumps(dict(self.snapshot(), time=time.time()))
+        if path is None:
+            print(line)
+            return
+        with open(path, 'a') as f:
+            f.write(line + "\n")
+
+
 # bind to specific ip on ethernet adapter
 ## Replace with the IP address of the Ethernet adapter you want to use
 #local_ip = '192.168.1.100'  # Your Ethernet adapter's IP
@@ -22,32 +126,35 @@ import math
 
 
 
-class Server():
+class Stream():
+    # Per-vehicle sequence numbers, send times, delta state and subscribers.
+    # vehicle_id None is the untagged stream of the ego vehicle
 
-    UDP_IP = "0.0.0.0"
-    UDP_PORT = 5005
-    CHUNK_SIZE = 1024
-    ACK_TIMEOUT = 10  # seconds
-    Client_addr = None
+    def __init__(self, vehicle_id, history):
+        self.vehicle_id = vehicle_id
+        # Sequence numbers and monotonic send times, ACKs echo the sequence number for RTT
+        self.seq = 0
+        self.sent_times = [None] * history
+        # Delta encoding: field values of the previous packet, and whether the next
+        # one must be a keyframe (start, or a subscriber that has no state yet)
+        self.last_values = None
+        self.keyframe_due = True
+        self.targets = ()
+        self.ack_targets = 0  # targets that ACK, what each packet expects back
 
 
-    def __init__(self, ip=UDP_IP, port=UDP_PORT):
-        self.ip = ip
-        self.port = port
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind((self.ip, self.port))
-        self.sock.settimeout(self.ACK_TIMEOUT)
-        print(f"Server started at {self.ip}:{self.port}")
+class TelemetryBase():
+    # Sample generation, per-vehicle streams and statistics shared by every transport,
+    # the UDP servers and SHM_Server.ShmServer
 
-    def start(self):
-        print("Waiting for client...")
-        while True:
-            data, self.Client_addr = self.sock.recvfrom(512)
-            if data.decode() == "READY":
-                print(f"Client ready: {self.Client_addr}")
-                break
+    SENT_HISTORY = 1  # send times kept per stream, only transports with ACKs keep more
+
+    def __init__(self):
+        self.client_ready = threading.Event()
+        # One stream per vehicle, created on its first sample
+        self.streams = {None: Stream(None, self.SENT_HISTORY)}
+        self.stats = AckStats()
 
-    
     def calculate_rpm(self, speed_kph):
        final_drive = 3.9
        tire_diameter_m = 0.65
@@ -68,25 +175,331 @@ class Server():
                result_rpm = int(rpm)
                break
        return selected_gear, result_rpm
-           
-    
-    
-    
-    def send_data(self,speed):
 
-      # Calculate RPM
-      gear , rpm = self.calculate_rpm(speed)
-      temperature = random.randint(70, 110)
-      fuel = random.randint(0, 100)
+    def next_sample(self, stream, speed):
+        # (seq, rpm, temperature, fuel, gear) of the stream's next sample
+        gear, rpm = self.calculate_rpm(speed)
+        temperature = random.randint(70, 110)
+        fuel = random.randint(0, 100)
+        seq = stream.seq
+        stream.seq = (seq + 1) & 0xFFFFFFFF
+        return seq, rpm, temperature, fuel, gear
+
+
+class ServerBase(TelemetryBase):
+    # Subscriber registry and packet encoding shared by the threaded and asyncio servers
+
+    UDP_IP = "0.0.0.0"
+    UDP_PORT = 5005
+    MULTICAST_PORT = 5006  # group destination port, apart from UDP_PORT so clients on this host can bind it
+    CHUNK_SIZE = 1024
+    ACK_TIMEOUT = 10  # seconds without READY/ACK before a subscriber expires
+    POLL_INTERVAL = 1.0  # seconds, listener wake-up for expiry checks
+    SENT_HISTORY = 1024  # send times kept to match ACKs, must be a power of two
+    KEYFRAME_INTERVAL = 20  # with WIRE_DELTA, a full frame every this many packets (1 s at 20 Hz)
+
+
+    def __init__(self, ip=UDP_IP, port=UDP_PORT, wire_format=WIRE_TEXT, multicast_group=None, multicast_ttl=1,
+                 multicast_port=MULTICAST_PORT):
+        if wire_format not in (WIRE_TEXT, WIRE_BINARY, WIRE_DELTA):
+            raise ValueError(f"Unknown wire format: {wire_format}")
+        super().__init__()
+        self.ip = ip
+        self.port = port
+        self.wire_format = wire_format
+
+        # Optional multicast group, when set every packet goes out once to the group
+        # and the subscriber registry is only kept for liveness/bookkeeping
+        self.multicast_addr = (multicast_group, multicast_port) if multicast_group else None
+        self.multicast_ttl = multicast_ttl
+
+        # Subscriber registry: addr -> time of last READY/ACK, and addr -> subscribed
+        # vehicle (None, an id or FLEET_ALL). The send path only reads the immutable
+        # targets tuples, self.targets for everyone and one per stream, rebuilt on change
+        self.subscribers = {}
+        self.subscriptions = {}
+        self.silent = set()  # subscribers that sent READY;NOACK
+        self.subscribers_lock = threading.Lock()
+        self.targets = ()
+
+    def stream(self, vehicle_id=None):
+        stream = self.streams.get(vehicle_id)
+        if stream is None:
+            with self.subscribers_lock:
+                stream = Stream(vehicle_id, self.SENT_HISTORY)
+                self.retarget(stream)
+                self.streams[vehicle_id] = stream
+        return stream
+
+    def stream_targets(self, vehicle_id):
+        return tuple(addr for addr, wanted in self.subscriptions.items()
+                     if wanted == vehicle_id or (vehicle_id is not None and wanted == FLEET_ALL))
+
+    def retarget(self, stream):
+        # With subscribers_lock held
+        stream.targets = self.stream_targets(stream.vehicle_id)
+        stream.ack_targets = sum(addr not in self.silent for addr in stream.targets)
+
+    def update_targets(self):
+        # With subscribers_lock held, after the registry changed
+        self.targets = tuple(self.subscribers)
+        for stream in list(self.streams.values()):
+            self.retarget(stream)
+
+    def handle_message(self, data, addr, now):
+        if data.startswith(b"READY"):
+            subscription, _, mode = data.partition(b";")
+            acks = mode != b"NOACK"
+            if subscription == b"READY":
+                self.add_subscriber(addr, now, acks=acks)
+            elif subscription.startswith(b"READY:"):
+                wanted = subscription[6:]
+                if wanted == FLEET_ALL.encode():
+                    self.add_subscriber(addr, now, FLEET_ALL, acks)
+                elif wanted.isdigit():
+                    self.add_subscriber(addr, now, int(wanted), acks)
+        elif data.startswith(b"ACK"):
+            with self.subscribers_lock:
+                if addr in self.subscribers:
+                    self.subscribers[addr] = now
+            if data[3:4] == b":":
+                self.handle_ack(data[4:], now, addr)
+        elif data == b"BYE":
+            self.remove_subscriber(addr)
+
+    def add_subscriber(self, addr, now=None, vehicle_id=None, acks=True):
+        with self.subscribers_lock:
+            new = self.subscriptions.get(addr, ()) != vehicle_id
+            self.subscribers[addr] = time.monotonic() if now is None else now
+            if new or acks == (addr in self.silent):
+                self.subscriptions[addr] = vehicle_id
+                if acks:
+                    self.silent.discard(addr)
+                else:
+                    self.silent.add(addr)
+                self.update_targets()
+        if new:
+            print(f"Client ready: {addr}" + ("" if vehicle_id is None else f" (vehicle {vehicle_id})"))
+            for stream in list(self.streams.values()):
+                stream.keyframe_due = True
+            self.client_ready.set()
+
+    def remove_subscriber(self, addr):
+        with self.subscribers_lock:
+            if self.subscribers.pop(addr, None) is None:
+                return
+            del self.subscriptions[addr]
+            self.silent.discard(addr)
+            self.update_targets()
+        self.stats.forget(addr)
+        print(f"Client left: {addr}")
+
+    def expire_subscribers(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.subscribers_lock:
+            expired = [addr for addr, seen in self.subscribers.items() if now - seen > self.ACK_TIMEOUT]
+            for addr in expired:
+                del self.subscribers[addr]
+                del self.subscriptions[addr]
+                self.silent.discard(addr)
+            if expired:
+                self.update_targets()
+        for addr in expired:
+            self.stats.forget(addr)
+            print(f"Client expired: {addr}")
+
+    def handle_ack(self, seq_field, now, addr=None):
+        # "<seq>" for the untagged stream, "<seq>:<vehicle id>" for a fleet stream, then
+        # ";<count>" when it also stands for count superseded datagrams the subscriber skipped
+        seq_field, _, coalesced_field = seq_field.partition(b";")
+        seq_field, _, id_field = seq_field.partition(b":")
+        try:
+            seq = int(seq_field)
+            vehicle_id = int(id_field) if id_field else None
+            coalesced = int(coalesced_field) if coalesced_field else 0
+        except ValueError:
+            return
+        stream = self.streams.get(vehicle_id)
+        if stream is None:
+            return
+        entry = stream.sent_times[seq & (self.SENT_HISTORY - 1)]
+        if entry is not None and entry[0] == seq:
+            self.stats.add_ack(seq, now - entry[1], addr, vehicle_id, coalesced)
+
+    def send_data(self,speed, vehicle_id=None):
+
+      # Fleet vehicles nobody subscribed to are not even encoded
+      stream = self.stream(vehicle_id)
+      if vehicle_id is not None and not stream.targets and self.multicast_addr is None:
+          return
 
       # Create a data packet
-      data_packet = f"SPEED:{speed},RPM:{rpm},TEMP:{temperature},FUEL:{fuel},GEAR:{gear}"
-      # Send the data packet to the client
-      self.sock.sendto(data_packet.encode(), self.Client_addr)
+      seq, rpm, temperature, fuel, gear = self.next_sample(stream, speed)
+      data_packet = self.encode_packet(seq, time.time(), speed, rpm, temperature, fuel, gear, vehicle_id)
+      # Send the data packet to the stream's subscribers
+      stream.sent_times[seq & (self.SENT_HISTORY - 1)] = (seq, time.monotonic())
+      self.send_packet(data_packet, stream.targets)
+      self.stats.add_sent(stream.ack_targets)
       #print(f"Sent data: {data_packet}")
 
+    def encode_packet(self, seq, timestamp, speed, rpm, temperature, fuel, gear, vehicle_id=None):
+        if self.wire_format == WIRE_DELTA:
+            return self.encode_delta(seq, timestamp, (int(speed), int(rpm), int(temperature), int(fuel), int(gear)),
+                                     vehicle_id)
+        if self.wire_format == WIRE_BINARY:
+            if vehicle_id is not None:
+                return TAGGED_FRAME.pack(WIRE_MAGIC, WIRE_VERSION, FRAME_SAMPLE | FRAME_TAGGED, len(SAMPLE_FIELDS),
+                                         seq, timestamp, vehicle_id,
+                                         int(speed), int(rpm), int(temperature), int(fuel), int(gear))
+            return FRAME.pack(WIRE_MAGIC, WIRE_VERSION, FRAME_SAMPLE, len(SAMPLE_FIELDS), seq, timestamp,
+                              int(speed), int(rpm), int(temperature), int(fuel), int(gear))
+        tag = "" if vehicle_id is None else f",ID:{vehicle_id}"
+        return (f"SPEED:{speed},RPM:{rpm},TEMP:{temperature},FUEL:{fuel},GEAR:{gear},"
+                f"SEQ:{seq},TS:{timestamp:.6f}{tag}").encode()
+
+    def encode_delta(self, seq, timestamp, values, vehicle_id=None):
+        # Keyframe periodically and on demand, so a receiver that missed a packet resyncs
+        stream = self.stream(vehicle_id)
+        last_values, stream.last_values = stream.last_values, values
+        if stream.keyframe_due or last_values is None or seq % self.KEYFRAME_INTERVAL == 0:
+            stream.keyframe_due = False
+            if vehicle_id is not None:
+                return TAGGED_FRAME.pack(WIRE_MAGIC, WIRE_VERSION, FRAME_SAMPLE | FRAME_TAGGED, len(SAMPLE_FIELDS),
+                                         seq, timestamp, vehicle_id, *values)
+            return FRAME.pack(WIRE_MAGIC, WIRE_VERSION, FRAME_SAMPLE, len(SAMPLE_FIELDS), seq, timestamp, *values)
+        mask = 0
+        changed = []
+        if values != last_values:
+            for i, value in enumerate(values):
+                if value != last_values[i]:
+                    mask |= 1 << i
+                    changed.append(value)
+        if vehicle_id is not None:
+            return HEADER.pack(WIRE_MAGIC, WIRE_VERSION, FRAME_DELTA | FRAME_TAGGED, len(changed), seq, timestamp) \
+                + TAG.pack(vehicle_id) + DELTA_BODIES[mask].pack(mask, *changed)
+        return HEADER.pack(WIRE_MAGIC, WIRE_VERSION, FRAME_DELTA, len(changed), seq, timestamp) \
+            + DELTA_BODIES[mask].pack(mask, *changed)
+
+
+class Server(ServerBase):
 
+    def __init__(self, ip=ServerBase.UDP_IP, port=ServerBase.UDP_PORT, wire_format=WIRE_TEXT,
+                 multicast_group=None, multicast_ttl=1, multicast_port=ServerBase.MULTICAST_PORT):
+        super().__init__(ip, port, wire_format, multicast_group, multicast_ttl, multicast_port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((self.ip, self.port))
+        self.sock.settimeout(self.POLL_INTERVAL)
+        if self.multicast_addr is not None:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.multicast_ttl)
+
+        self.listener = None
+        self.running = False
+        print(f"Server started at {self.ip}:{self.port}")
+
+    def start(self, wait_for_client=False):
+        if self.listener is None:
+            self.running = True
+            self.listener = threading.Thread(target=self.listen, daemon=True)
+            self.listener.start()
+        if wait_for_client:
+            print("Waiting for client...")
+            self.client_ready.wait()
+
+    def stop(self):
+        self.running = False
+        if self.listener is not None:
+            self.listener.join(self.POLL_INTERVAL * 2)
+            self.listener = None
+        self.sock.close()
+
+    def listen(self):
+        # Picks up READY/ACK/BYE from subscribers without blocking the sim loop
+        last_expiry = time.monotonic()
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(512)
+            except socket.timeout:
+                data = None
+            except ConnectionResetError:
+                # Windows reports ICMP port unreachable from a vanished subscriber here
+                continue
+            except OSError:
+                break
+
+            now = time.monotonic()
+            if data is not None:
+                self.handle_message(data, addr, now)
+            if now - last_expiry >= self.POLL_INTERVAL:
+                self.expire_subscribers(now)
+                last_expiry = now
+
+    def send_packet(self, data_packet, targets=None):
+        # Serialized once, fanned out to the multicast group or every live subscriber of the stream
+        if self.multicast_addr is not None:
+            try:
+                self.sock.sendto(data_packet, self.multicast_addr)
+            except OSError as e:
+                print(f"Send to {self.multicast_addr} failed: {e}")
+            return
+        for addr in self.targets if targets is None else targets:
+            try:
+                self.sock.sendto(data_packet, addr)
+            except OSError as e:
+                print(f"Send to {addr} failed: {e}")
+
+
+class AsyncServer(ServerBase, asyncio.DatagramProtocol):
+    # asyncio flavour of Server: registration, expiry and sends all run on the event loop,
+    # so many servers/streams can share one loop without a listener thread each
+
+    def __init__(self, ip=ServerBase.UDP_IP, port=ServerBase.UDP_PORT, wire_format=WIRE_TEXT,
+                 multicast_group=None, multicast_ttl=1, multicast_port=ServerBase.MULTICAST_PORT):
+        super().__init__(ip, port, wire_format, multicast_group, multicast_ttl, multicast_port)
+        self.client_ready = asyncio.Event()
+        self.transport = None
+        self.expiry_task = None
+
+    async def start(self, wait_for_client=False):
+        loop = asyncio.get_running_loop()
+        if self.transport is None:
+            await loop.create_datagram_endpoint(lambda: self, local_addr=(self.ip, self.port))
+            self.expiry_task = loop.create_task(self.expire_loop())
+            print(f"Server started at {self.ip}:{self.port}")
+        if wait_for_client:
+            print("Waiting for client...")
+            await self.client_ready.wait()
+
+    def stop(self):
+        if self.expiry_task is not None:
+            self.expiry_task.cancel()
+            self.expiry_task = None
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    async def expire_loop(self):
+        while True:
+            await asyncio.sleep(self.POLL_INTERVAL)
+            self.expire_subscribers()
 
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.multicast_addr is not None:
+            sock = transport.get_extra_info('socket')
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.multicast_ttl)
 
+    def datagram_received(self, data, addr):
+        self.handle_message(data, addr, time.monotonic())
 
+    def error_received(self, exc):
+        # ICMP errors from vanished subscribers, they expire on their own
+        pass
 
+    def send_packet(self, data_packet, targets=None):
+        if self.transport is None:
+            return
+        if self.multicast_addr is not None:
+            self.transport.sendto(data_packet, self.multicast_addr)
+            return
+        for addr in self.targets if targets is None else targets:
+            self.transport.sendto(data_packet, addr)
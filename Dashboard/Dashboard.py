@@ -1,15 +1,52 @@
+import argparse
 import sys
 import threading
-from UDP_Client import Client
+from UDP_Client import Client, RECEIVE_LATEST
+from SHM_Client import SHM_NAME, ShmClient
 from PySide6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton
-from PySide6.QtGui import QPainter, QPen, QFont, QColor
-from PySide6.QtCore import Qt, QTimer, QRectF, QPropertyAnimation, Property, QVariantAnimation
+from PySide6.QtGui import QPainter, QPen, QFont, QColor, QPixmap
+from PySide6.QtCore import Qt, QTimer, QRectF, QPropertyAnimation, Property, QVariantAnimation, QObject, Signal
 import random
 import math
+import time
+
+
+class TelemetryBridge(QObject):
+    # Hands samples from the client's thread to the GUI thread. Samples arriving
+    # while one is still queued only replace it, so a busy GUI never falls behind
+
+    sample_ready = Signal()
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+        self.lock = threading.Lock()
+        self.latest = None
+        self.pending = False
+
+    def on_sample(self):
+        # Client thread
+        sample = self.client.data_dict
+        with self.lock:
+            self.latest = sample
+            if self.pending:
+                return
+            self.pending = True
+        self.sample_ready.emit()
+
+    def take(self):
+        # GUI thread
+        with self.lock:
+            self.pending = False
+            return self.latest
 
 
 class DigitalClusterWidget(QWidget):
-    def __init__(self):
+
+    MIN_ANIM_MS = 30
+    MAX_ANIM_MS = 250  # bounds the display lag behind the latest sample
+
+    def __init__(self, client=None):
         super().__init__()
         self._speed = 0
         self._rpm = 0
@@ -17,24 +54,32 @@ class DigitalClusterWidget(QWidget):
         self._fuel = 50
         self._gear = 'N'
 
-        self.speed_anim = QVariantAnimation(duration=800)
+        self.speed_anim = QVariantAnimation(duration=self.MAX_ANIM_MS)
         self.speed_anim.valueChanged.connect(self.update_speed_value)
 
-        self.rpm_anim = QVariantAnimation(duration=800)
+        self.rpm_anim = QVariantAnimation(duration=self.MAX_ANIM_MS)
         self.rpm_anim.valueChanged.connect(self.update_rpm_value)
 
-        self.temp_anim = QVariantAnimation(duration=800)
+        self.temp_anim = QVariantAnimation(duration=self.MAX_ANIM_MS)
         self.temp_anim.valueChanged.connect(self.update_temp_value)
 
-        self.fuel_anim = QVariantAnimation(duration=800)
+        self.fuel_anim = QVariantAnimation(duration=self.MAX_ANIM_MS)
         self.fuel_anim.valueChanged.connect(self.update_fuel_value)
 
+        # Smoothed time between samples, the needles take that long to reach each new value
+        self.sample_interval = None
+        self.last_sample_time = None
+
         self._night_mode = True
         self.bg_color = QColor(10, 10, 10)
 
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_dashboard_data)
-        self.timer.start(1000)  # Update every second
+        # Built once: fonts, and the dial rings, ticks, labels and center panel
+        # rendered into a transparent layer that is redrawn on resize or day/night change
+        self.tick_font = QFont("Arial", 12, QFont.Bold)
+        self.value_font = QFont("Arial", 14, QFont.Bold)
+        self.center_font = QFont("Arial", 18, QFont.Bold)
+        self.static_layer = None
+        self.static_key = None  # (width, height, pixel ratio, night mode) the layer was drawn for
 
         self.bg_anim = QVariantAnimation(
             startValue=QColor(10, 10, 10),
@@ -43,26 +88,46 @@ class DigitalClusterWidget(QWidget):
         )
         self.bg_anim.valueChanged.connect(self.on_bg_anim_value_changed)
 
-        # Initialize the Client instance
-        self.client = Client()
-        self.client.client_thread(self.client.data_callback)
+        # Initialize the Client instance, UDP unless one is passed in.
+        # Every UDP sample is pushed from the client's thread through the bridge
+        self.client = client if client is not None else Client()
+        self.bridge = None
+        self.frame_timer = None
+        if isinstance(self.client, ShmClient):
+            # Shared memory is read without a syscall: look for a new sample once per
+            # displayed frame on the GUI thread, no thread and no extra wake-ups
+            screen = QApplication.primaryScreen()
+            refresh_hz = screen.refreshRate() if screen is not None and screen.refreshRate() > 0 else 60.0
+            self.frame_timer = QTimer(self)
+            self.frame_timer.setTimerType(Qt.PreciseTimer)
+            self.frame_timer.timeout.connect(self.poll_client)
+            self.frame_timer.start(max(1, int(1000 / refresh_hz)))
+        else:
+            self.bridge = TelemetryBridge(self.client)
+            self.bridge.sample_ready.connect(self.update_dashboard_data)
+            self.client.client_thread(self.bridge.on_sample)
 
 
+    # The animations step far more often than the integer values change, only repaint on a change
     def update_speed_value(self, value):
-        self._speed = int(value)
-        self.update()
+        if int(value) != self._speed:
+            self._speed = int(value)
+            self.update()
 
     def update_rpm_value(self, value):
-        self._rpm = int(value)
-        self.update()
+        if int(value) != self._rpm:
+            self._rpm = int(value)
+            self.update()
 
     def update_temp_value(self, value):
-        self._temp = int(value)
-        self.update()
+        if int(value) != self._temp:
+            self._temp = int(value)
+            self.update()
 
     def update_fuel_value(self, value):
-        self._fuel = int(value)
-        self.update()
+        if int(value) != self._fuel:
+            self._fuel = int(value)
+            self.update()
 
     def get_night_mode(self):
         return self._night_mode
@@ -84,33 +149,52 @@ class DigitalClusterWidget(QWidget):
     def toggle_mode(self):
         self.night_mode = not self.night_mode
 
-    def update_dashboard_data(self):
-        self.speed_anim.setStartValue(self._speed)
-        self.speed_anim.setEndValue(int(self.client.data_dict['SPEED']))
-        print(f"Speed: {self.client.data_dict['SPEED']}")
-        self.speed_anim.start()
+    def animation_ms(self):
+        now = time.monotonic()
+        if self.last_sample_time is not None:
+            interval = now - self.last_sample_time
+            self.sample_interval = interval if self.sample_interval is None \
+                else self.sample_interval + 0.2 * (interval - self.sample_interval)
+        self.last_sample_time = now
+        if self.sample_interval is None:
+            return self.MAX_ANIM_MS
+        return int(min(self.MAX_ANIM_MS, max(self.MIN_ANIM_MS, 1000 * self.sample_interval)))
+
+    def retarget(self, anim, current, target):
+        # Restart from where the needle is now towards the new value
+        anim.stop()
+        anim.setStartValue(current)
+        anim.setEndValue(int(target))
+        anim.start()
+
+    def poll_client(self):
+        if self.client.poll():
+            self.show_sample(self.client.sample)
 
-        self.rpm_anim.setStartValue(self._rpm)
-        self.rpm_anim.setEndValue(int(self.client.data_dict.get('RPM', self._rpm)))
-        self.rpm_anim.start()
+    def update_dashboard_data(self):
+        sample = self.bridge.take()
+        if sample is not None:
+            self.show_sample(sample)
 
-        self.temp_anim.setStartValue(self._temp)
-        self.temp_anim.setEndValue(int(self.client.data_dict.get('TEMP', self._temp)))
-        self.temp_anim.start()
+    def show_sample(self, sample):
+        duration = self.animation_ms()
+        for anim in (self.speed_anim, self.rpm_anim, self.temp_anim, self.fuel_anim):
+            anim.setDuration(duration)
 
-        self.fuel_anim.setStartValue(self._fuel)
-        self.fuel_anim.setEndValue(int(self.client.data_dict.get('FUEL', self._fuel)))
-        self.fuel_anim.start()
+        self.retarget(self.speed_anim, self._speed, sample['SPEED'])
+        self.retarget(self.rpm_anim, self._rpm, sample.get('RPM', self._rpm))
+        self.retarget(self.temp_anim, self._temp, sample.get('TEMP', self._temp))
+        self.retarget(self.fuel_anim, self._fuel, sample.get('FUEL', self._fuel))
 
-        
-        gear = self.client.data_dict.get('GEAR', self._gear)
+        gear = sample.get('GEAR', self._gear)
         if gear != "0":
             self._gear = gear
         else:
             self._gear = "N"
         self.update()
     
-    def draw_analog_gauge(self, painter, rect, value, max_value, color, label):
+    def draw_gauge_face(self, painter, rect, max_value):
+        # Static part of a gauge: ring, tick marks and labels
         center = rect.center()
         radius = rect.width() / 2 - 10
 
@@ -120,7 +204,7 @@ class DigitalClusterWidget(QWidget):
         painter.drawEllipse(center, radius, radius)
 
         # Draw tick marks
-        painter.setFont(QFont("Arial", 12, QFont.Bold))
+        painter.setFont(self.tick_font)
         for i in range(0, 11):  # 10 major ticks
             angle = 225 - (270 * i / 10)
             x1 = center.x() + radius * math.cos(math.radians(angle))
@@ -135,6 +219,11 @@ class DigitalClusterWidget(QWidget):
             label_y = center.y() - (radius - 20) * math.sin(math.radians(angle))
             painter.drawText(int(label_x) - 10, int(label_y) + 5, f"{label_val}")
 
+    def draw_analog_gauge(self, painter, rect, value, max_value, color, label):
+        # Per-frame part of a gauge: needle and digital value
+        center = rect.center()
+        radius = rect.width() / 2 - 10
+
         # Draw needle
         needle_length = radius - (rect.width() // 15)
         angle = 225 - (270 * value / max_value)
@@ -149,44 +238,65 @@ class DigitalClusterWidget(QWidget):
 
         # Draw digital value
         painter.setPen(QColor(255, 255, 255) if self.night_mode else QColor(0, 0, 0))
-        painter.setFont(QFont("Arial", 14, QFont.Bold))
+        painter.setFont(self.value_font)
         painter.drawText(rect, Qt.AlignBottom | Qt.AlignCenter, f"{int(value)} {label}")
 
-    def draw_center_display(self, painter, rect):
+    def draw_center_panel(self, painter, rect):
         painter.setPen(Qt.NoPen)
         painter.setBrush(QColor(30, 30, 30) if self.night_mode else QColor(220, 220, 220))
         painter.drawRoundedRect(rect, 15, 15)
 
+    def draw_center_display(self, painter, rect):
         painter.setPen(QColor(255, 255, 255) if self.night_mode else QColor(0, 0, 0))
-        painter.setFont(QFont("Arial", 18, QFont.Bold))
+        painter.setFont(self.center_font)
         text = f"Gear: {self._gear}    Temp: {self._temp}°C    Fuel: {self._fuel}%"
         painter.drawText(rect, Qt.AlignCenter, text)
 
+    def layout_rects(self):
+        margin = 10
+        arc_size = min(self.width() * 1.5, self.height() * 1.5) / 2 - margin
+
+        # RPM analog gauge on left, speed analog gauge on right, center display at the bottom
+        rpm_rect = QRectF(margin + 30, margin + 30, arc_size, arc_size)
+        speed_rect = QRectF(self.width() - arc_size - margin - 30, margin + 30, arc_size, arc_size)
+        center_rect = QRectF(self.width() / 2 - 400, self.height() - 60, 800, 60)
+        return rpm_rect, speed_rect, center_rect
+
+    def render_static_layer(self):
+        ratio = self.devicePixelRatioF()
+        layer = QPixmap(int(self.width() * ratio), int(self.height() * ratio))
+        layer.setDevicePixelRatio(ratio)
+        layer.fill(Qt.transparent)
+
+        rpm_rect, speed_rect, center_rect = self.layout_rects()
+        painter = QPainter(layer)
+        painter.setRenderHint(QPainter.Antialiasing)
+        self.draw_gauge_face(painter, rpm_rect, 8000)
+        self.draw_gauge_face(painter, speed_rect, 260)
+        self.draw_center_panel(painter, center_rect)
+        painter.end()
+        return layer
+
     def paintEvent(self, event):
+        key = (self.width(), self.height(), self.devicePixelRatioF(), self._night_mode)
+        if key != self.static_key:
+            self.static_layer = self.render_static_layer()
+            self.static_key = key
+
         painter = QPainter(self)
         painter.setRenderHint(QPainter.Antialiasing)
 
-        # Animated background
+        # Animated background, then the cached dials on top of it
         painter.fillRect(self.rect(), self.bg_color)
+        painter.drawPixmap(0, 0, self.static_layer)
 
-        margin = 10
-        arc_size = min(self.width() * 1.5, self.height() * 1.5) / 2 - margin
-
-        # RPM analog gauge on left
-        rpm_rect = QRectF(margin + 30, margin + 30, arc_size, arc_size)
+        rpm_rect, speed_rect, center_rect = self.layout_rects()
         self.draw_analog_gauge(painter, rpm_rect, self._rpm, 8000, QColor(0, 170, 255), "RPM")
-
-        # Speed analog gauge on right
-        speed_rect = QRectF(self.width() - arc_size - margin - 30, margin + 30, arc_size, arc_size)
         self.draw_analog_gauge(painter, speed_rect, self._speed, 260, QColor(255, 100, 0), "km/h")
-
-        # Center display
-        center_rect = QRectF(self.width() / 2 - 400, self.height() - 60, 800, 60)
-
         self.draw_center_display(painter, center_rect)
 
 class DashboardWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, client=None):
         super().__init__()
 
         self.setWindowTitle("BMW Digital Cluster")
@@ -200,7 +310,7 @@ class DashboardWindow(QMainWindow):
         layout = QVBoxLayout()
 
         # Digital Cluster widget
-        self.digital_cluster = DigitalClusterWidget()
+        self.digital_cluster = DigitalClusterWidget(client)
         layout.addWidget(self.digital_cluster)
 
         # Toggle button
@@ -212,7 +322,28 @@ class DashboardWindow(QMainWindow):
         self.central_widget.setLayout(layout)
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = DashboardWindow()
+    argparser = argparse.ArgumentParser(description='Digital cluster for the CARLA telemetry')
+    argparser.add_argument('--transport', choices=['udp', 'shm'], default='udp',
+                           help='udp, or shm when Carla_Camera_app runs on this host with --telemetry shm')
+    argparser.add_argument('--shm-name', metavar='NAME', default=SHM_NAME,
+                           help='shared memory block name (default: %(default)s)')
+    argparser.add_argument('--rcvbuf', metavar='BYTES', type=int, default=None,
+                           help='UDP socket receive buffer size (default: OS default)')
+    argparser.add_argument('--no-ack', action='store_true',
+                           help='do not ACK samples, stay subscribed with periodic READY instead')
+    argparser.add_argument('--vehicle-id', metavar='ID', type=int, default=None,
+                           help='show this vehicle of a Carla_Camera_app --fleet (default: the ego vehicle)')
+    args, qt_args = argparser.parse_known_args()
+    if args.vehicle_id is not None and args.transport == 'shm':
+        argparser.error('--vehicle-id needs --transport udp')
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    if args.transport == 'shm':
+        client = ShmClient(args.shm_name)
+    else:
+        # The cluster only shows the newest sample, older ones queued behind it are skipped
+        client = Client(receive_mode=RECEIVE_LATEST, rcvbuf=args.rcvbuf, ack=not args.no_ack,
+                        vehicle_id=args.vehicle_id)
+    window = DashboardWindow(client)
     window.show()
     sys.exit(app.exec())
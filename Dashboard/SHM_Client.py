@@ -0,0 +1,132 @@
+"""
+Reader side of the same-host shared memory telemetry, see
+Carla_App/SHM_Server.py for the block layout and the seqlock.
+
+ShmClient stands in for UDP_Client.Client: data_dict always holds the
+latest sample, read straight from the mapping when accessed, so there is
+no socket, no syscall and no parsing per read. There is no receive thread
+either: the consumer calls poll() from a loop it already runs, e.g. a GUI
+frame timer, and gets True for a new sample. Samples the server overwrote
+between two reads count as lost in the link statistics.
+"""
+
+import os
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from UDP_Client import LinkStats, TelemetryHistory
+
+
+# Block layout, keep in sync with Carla_App/SHM_Server.py
+SHM_NAME = "sdv_telemetry"
+SHM_MAGIC = b"SV"
+SHM_VERSION = 1
+HEADER = struct.Struct("<2sBBI")  # magic, version, closed, seqlock counter
+CLOSED_OFFSET = 3
+COUNTER = struct.Struct("<I")
+COUNTER_OFFSET = 4
+SAMPLE = struct.Struct("<IdHHhBB")  # seq, send time, SPEED, RPM, TEMP, FUEL, GEAR
+READER = struct.Struct("<d")
+SAMPLE_OFFSET = HEADER.size
+READER_OFFSET = SAMPLE_OFFSET + SAMPLE.size
+SHM_SIZE = READER_OFFSET + READER.size
+
+
+class ShmClient:
+
+    ATTACH_INTERVAL = 2  # seconds between attempts while the server's block does not exist
+    READ_RETRIES = 1000  # seqlock retries before giving up on a read
+
+    def __init__(self, name=SHM_NAME, history_size=4096):
+        self.name = name
+        self.running = True
+        self.stats = LinkStats()
+        self.history = TelemetryHistory(history_size) if history_size else None
+        self.block = None
+        self.buf = None
+        self.next_attach = 0.0
+        self.last_seq = None
+        self.sample = {
+            'SPEED': 0,
+            'RPM': 0,
+            'TEMP': 0,
+            'FUEL': 0,
+            'GEAR': 'N'
+        }
+
+    def attach(self):
+        now = time.monotonic()
+        if now < self.next_attach:
+            return False
+        self.next_attach = now + self.ATTACH_INTERVAL
+        try:
+            block = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return False
+        # The server owns the block: keep this process's resource tracker
+        # from unlinking it when the dashboard exits
+        if os.name == 'posix':
+            resource_tracker.unregister(block._name, 'shared_memory')
+        magic, version, closed, _ = HEADER.unpack_from(block.buf)
+        if block.size < SHM_SIZE or magic != SHM_MAGIC or version != SHM_VERSION or closed:
+            block.close()
+            return False
+        self.block = block
+        self.buf = block.buf
+        print(f"Attached to shared memory {self.name}")
+        return True
+
+    def detach(self):
+        self.buf = None
+        if self.block is not None:
+            self.block.close()
+            self.block = None
+
+    def read(self):
+        # Copy of the sample fields, or None while the server is writing for too long
+        for _ in range(self.READ_RETRIES):
+            before = COUNTER.unpack_from(self.buf, COUNTER_OFFSET)[0]
+            if before & 1:
+                continue
+            fields = SAMPLE.unpack_from(self.buf, SAMPLE_OFFSET)
+            if COUNTER.unpack_from(self.buf, COUNTER_OFFSET)[0] == before:
+                return fields
+        return None
+
+    def poll(self):
+        """Picks up the latest sample, returns True when it is a new one."""
+        if self.buf is None and not (self.running and self.attach()):
+            return False
+        if self.buf[CLOSED_OFFSET]:
+            # Server stopped, attach to its successor once it shows up
+            self.detach()
+            return False
+        now = time.time()
+        READER.pack_into(self.buf, READER_OFFSET, now)
+        fields = self.read()
+        if fields is None:
+            return False
+        seq, timestamp, speed, rpm, temp, fuel, gear = fields
+        if seq == self.last_seq or not timestamp:
+            return False
+        self.last_seq = seq
+        self.sample = {'SPEED': speed, 'RPM': rpm, 'TEMP': temp, 'FUEL': fuel, 'GEAR': str(gear),
+                       'SEQ': seq, 'TS': timestamp}
+        self.stats.add(seq, timestamp, now)
+        if self.history is not None:
+            self.history.append(self.sample, now)
+        return True
+
+    @property
+    def data_dict(self):
+        self.poll()
+        return self.sample
+
+    def data_callback(self):
+        sample = self.sample
+        print(f"Callback: Received Data: Speed={sample['SPEED']} RPM={sample['RPM']} Temp={sample['TEMP']} Fuel={sample['FUEL']} Gear={sample['GEAR']}")
+
+    def close(self):
+        self.running = False
+        self.detach()
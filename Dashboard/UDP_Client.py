@@ -1,13 +1,253 @@
+import asyncio
+import collections
+import json
 import socket
 import select
+import struct
 import threading
+import time
 
-class Client:
-    def __init__(self, udp_ip="localhost", udp_port=5005):
+import numpy as np
+
+
+# Wire formats sent by Carla_App/UDP_Server.Server
+WIRE_TEXT = "text"
+WIRE_BINARY = "binary"
+WIRE_AUTO = "auto"        # pick per datagram from the frame magic (keyframes and deltas are binary)
+
+# Destination port of the server's multicast group, apart from its own port
+# so a client on the server's host can bind it
+MULTICAST_PORT = 5006
+
+# Client receive modes, both drain every pending datagram per wake-up
+RECEIVE_ALL = "all"        # handle every datagram, e.g. for loggers
+RECEIVE_LATEST = "latest"  # handle only the newest datagram per sender and vehicle, e.g. for displays
+
+# Subscriptions: vehicle_id None is the server's untagged ego stream, an id one fleet
+# vehicle's tagged stream, FLEET_ALL every fleet vehicle's (e.g. a fleet monitor)
+FLEET_ALL = "*"
+
+# Binary frame layout, keep in sync with Carla_App/UDP_Server.py
+WIRE_MAGIC = b"SV"
+WIRE_VERSION = 2
+FRAME_SAMPLE = 1  # keyframe: every field
+FRAME_DELTA = 2   # header, changed-field bitmask (bit i = SAMPLE_FIELDS[i]), then those fields in order
+FRAME_TAGGED = 0x80  # frame type flag: a vehicle id (TAG) follows the header, fleet streams
+HEADER = struct.Struct("<2sBBBId")  # magic, version, frame type, field count, seq, send time (epoch s)
+FRAME_TYPE_OFFSET = 3
+TAG = struct.Struct("<I")  # vehicle id (CARLA actor id)
+SAMPLE = struct.Struct("<HHhBB")   # SPEED, RPM, TEMP, FUEL, GEAR
+SAMPLE_FIELDS = ("SPEED", "RPM", "TEMP", "FUEL", "GEAR")
+# Delta body per changed-field mask, and which fields it carries
+DELTA_BODIES = tuple(struct.Struct("<B" + "".join(code for i, code in enumerate(SAMPLE.format[1:]) if mask & (1 << i)))
+                     for mask in range(1 << len(SAMPLE_FIELDS)))
+DELTA_FIELDS = tuple(tuple(i for i in range(len(SAMPLE_FIELDS)) if mask & (1 << i))
+                     for mask in range(1 << len(SAMPLE_FIELDS)))
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def tagged_vehicle(data):
+    # Vehicle id of a fleet stream datagram without decoding it, None when untagged
+    if data[:2] == WIRE_MAGIC:
+        if len(data) >= HEADER.size + TAG.size and data[FRAME_TYPE_OFFSET] & FRAME_TAGGED:
+            return TAG.unpack_from(data, HEADER.size)[0]
+        return None
+    _, tagged, vehicle_id = data.rpartition(b",ID:")
+    return int(vehicle_id) if tagged and vehicle_id.isdigit() else None
+
+
+class LinkStats:
+    # Rolling receive-side statistics from the packets' sequence numbers and send times.
+    # Latency compares the sender's wall clock with ours, so it is only absolute when both
+    # hosts are time synced; jitter, loss and reordering do not depend on that.
+
+    WINDOW = 1024  # latency samples kept for percentiles
+    RESTART_GAP = 1000  # a sequence number this far behind means the server restarted
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.latencies = collections.deque(maxlen=self.WINDOW)
+        self.first_seq = None
+        self.highest_seq = None
+        self.received = 0
+        self.coalesced = 0
+        self.reordered = 0
+        self.jitter = 0.0
+        self.last_transit = None
+
+    def add(self, seq, sent_time, arrival_time):
+        if self.highest_seq is not None and self.highest_seq - seq > self.RESTART_GAP:
+            self.reset()
+        if self.first_seq is None:
+            self.first_seq = self.highest_seq = seq
+        elif seq > self.highest_seq:
+            self.highest_seq = seq
+        elif seq < self.highest_seq:
+            self.reordered += 1
+        self.received += 1
+
+        transit = arrival_time - sent_time
+        self.latencies.append(transit)
+        # RFC 3550 interarrival jitter
+        if self.last_transit is not None:
+            self.jitter += (abs(transit - self.last_transit) - self.jitter) / 16
+        self.last_transit = transit
+
+    def skip(self, count):
+        # Datagrams that arrived but were superseded in the same batch, not lost
+        self.coalesced += count
+
+    def snapshot(self):
+        latencies = sorted(self.latencies)
+        to_ms = lambda v: None if v is None else round(v * 1000, 3)
+        expected = 0 if self.first_seq is None else self.highest_seq - self.first_seq + 1
+        lost = max(0, expected - self.received - self.coalesced)
+        return {
+            'received': self.received,
+            'coalesced': self.coalesced,
+            'lost': lost,
+            'loss': round(lost / expected, 4) if expected else 0.0,
+            'reordered': self.reordered,
+            'latency_p50_ms': to_ms(percentile(latencies, 0.50)),
+            'latency_p99_ms': to_ms(percentile(latencies, 0.99)),
+            'jitter_ms': round(self.jitter * 1000, 3),
+        }
+
+    def dump(self, path=None):
+        # One JSON line per call, appended to path or printed
+        line = json.dumps(dict(self.snapshot(), time=time.time()))
+        if path is None:
+            print(line)
+            return
+        with open(path, 'a') as f:
+            f.write(line + "\n")
+
+class TelemetryHistory:
+    """
+    Last `capacity` samples of every signal, with their arrival times, in
+    NumPy rings.
+
+    Each sample is written twice, at i and i + capacity, so the newest
+    `capacity` entries are always one contiguous, time-ordered slice: append
+    is O(1) and window queries are a searchsorted plus vectorized reductions
+    over that slice. Appends come from the client thread, queries from
+    anywhere; both take a short lock and queries return copies. Values that
+    are not numbers (a text 'N' gear) are kept as NaN and ignored.
+    """
+
+    SIGNALS = ('SPEED', 'RPM', 'TEMP', 'FUEL', 'GEAR')
+
+    def __init__(self, capacity=4096, signals=SIGNALS):
+        self.capacity = capacity
+        self.signals = {name: row for row, name in enumerate(signals)}
+        self.times = np.zeros(2 * capacity)
+        self.values = np.full((len(signals), 2 * capacity), np.nan)
+        self.head = 0  # next write position in [0, capacity)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def append(self, sample, arrival_time=None):
+        arrival_time = time.time() if arrival_time is None else arrival_time
+        column = np.full(len(self.signals), np.nan)
+        for name, row in self.signals.items():
+            try:
+                column[row] = float(sample[name])
+            except (KeyError, TypeError, ValueError):
+                pass
+        with self.lock:
+            i = self.head
+            self.times[i] = self.times[i + self.capacity] = arrival_time
+            self.values[:, i] = self.values[:, i + self.capacity] = column
+            self.head = (i + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def window(self, signal, seconds=None, now=None):
+        """(times, values) of `signal` over the last `seconds`, oldest first."""
+        row = self.signals[signal]
+        with self.lock:
+            end = self.head + self.capacity
+            start = end - self.count
+            times = self.times[start:end]
+            first = 0
+            if seconds is not None:
+                now = time.time() if now is None else now
+                first = np.searchsorted(times, now - seconds, side='left')
+            return times[first:].copy(), self.values[row, start + first:end].copy()
+
+    def stats(self, signal, seconds=None, now=None):
+        _, values = self.window(signal, seconds, now)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return {'count': 0, 'min': None, 'max': None, 'mean': None}
+        return {'count': len(values), 'min': float(values.min()), 'max': float(values.max()),
+                'mean': float(values.mean())}
+
+    def series(self, signal, points, seconds=None, now=None):
+        """At most `points` bucket means over the window, e.g. for a sparkline."""
+        times, values = self.window(signal, seconds, now)
+        if len(values) <= points:
+            return times, values
+        edges = np.linspace(0, len(values), points + 1).astype(np.int64)
+        counts = np.diff(edges)
+        valid = ~np.isnan(values)
+        sums = np.add.reduceat(np.where(valid, values, 0.0), edges[:-1])
+        hits = np.add.reduceat(valid.astype(np.int64), edges[:-1])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / hits
+        return np.add.reduceat(times, edges[:-1]) / counts, means
+
+    def rate(self, signal, seconds=None, now=None):
+        """Least-squares slope of `signal` in units per second, None with fewer than two samples."""
+        times, values = self.window(signal, seconds, now)
+        valid = ~np.isnan(values)
+        times, values = times[valid], values[valid]
+        if len(values) < 2:
+            return None
+        dt = times - times.mean()
+        spread = np.dot(dt, dt)
+        if spread == 0:
+            return None
+        return float(np.dot(dt, values - values.mean()) / spread)
+
+
+class ClientBase:
+    # Socket setup and packet decoding shared by the threaded and asyncio clients
+
+    READY_INTERVAL = 2  # seconds without data before READY is sent again (late join / server restart)
+
+    def __init__(self, udp_ip="localhost", udp_port=5005, wire_format=WIRE_AUTO, multicast_group=None,
+                 history_size=4096, vehicle_id=None, multicast_port=MULTICAST_PORT, ack=True):
+        if wire_format not in (WIRE_TEXT, WIRE_BINARY, WIRE_AUTO):
+            raise ValueError(f"Unknown wire format: {wire_format}")
         self.udp_ip = udp_ip
         self.udp_port = udp_port
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.settimeout(5)
+        self.wire_format = wire_format
+        self.multicast_group = multicast_group
+        self.multicast_port = multicast_port
+        self.vehicle_id = vehicle_id
+        # Without ACKs the server only hears READY;NOACK and expects no ACK from us
+        self.ack = ack
+        self.running = True
+        self.stats = LinkStats()
+        # Own vehicle's samples only; with FLEET_ALL the latest sample and link
+        # statistics of every vehicle instead, each stream has its own sequence numbers
+        self.history = TelemetryHistory(history_size) if history_size and vehicle_id != FLEET_ALL else None
+        self.fleet = {}
+        self.fleet_stats = {}
+        # Delta frames apply on top of the field values of the previous sequence number,
+        # vehicle id -> (values, seq, send time)
+        self.delta_state = {}
+        self.resyncs = 0
         self.data_dict = {
             'SPEED': 0,
             'RPM': 0,
@@ -16,41 +256,344 @@ class Client:
             'GEAR': 'N'
         }
 
+    def make_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.multicast_group:
+            # Several clients on one host may listen to the same group
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(("", self.multicast_port))
+            membership = socket.inet_aton(self.multicast_group) + socket.inet_aton("0.0.0.0")
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        return sock
+
+    def make_control_socket(self):
+        # READY, ACK and BYE of a multicast client go out from an ephemeral port of their
+        # own: the group port is shared by every client on the host, and the server tells
+        # subscribers apart by source address. None for unicast, the data socket is used
+        if not self.multicast_group:
+            return None
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        return sock
+
+    def ready_message(self):
+        message = b"READY" if self.vehicle_id is None else b"READY:" + str(self.vehicle_id).encode()
+        return message if self.ack else message + b";NOACK"
+
+    def wants(self, vehicle_id):
+        if self.vehicle_id == FLEET_ALL:
+            return vehicle_id is not None
+        return vehicle_id == self.vehicle_id
+
     def data_callback(self):
         print(f"Callback: Received Data: Speed={self.data_dict['SPEED']} RPM={self.data_dict['RPM']} Temp={self.data_dict['TEMP']} Fuel={self.data_dict['FUEL']} Gear={self.data_dict['GEAR']}")
 
+    def decode_packet(self, data):
+        """
+        The full sample in a datagram, or None for a delta that cannot be applied:
+        a duplicate or late one, or one after a gap, until the next keyframe.
+        Also None for another vehicle's stream than the one subscribed to.
+        """
+        binary = data[:2] == WIRE_MAGIC if self.wire_format == WIRE_AUTO else self.wire_format == WIRE_BINARY
+        if not binary:
+            # Legacy text format
+            sample = dict(key_value.split(':', 1) for key_value in data.decode().split(','))
+            if 'SEQ' in sample:
+                # Parsed here so track() never sees a malformed sequence number or send time
+                if 'TS' not in sample:
+                    raise ValueError("Text packet has SEQ but no TS")
+                sample['SEQ'] = int(sample['SEQ'])
+                sample['TS'] = float(sample['TS'])
+            if 'ID' in sample:
+                sample['ID'] = int(sample['ID'])
+            return sample if self.wants(sample.get('ID')) else None
+
+        magic, version, frame_type, field_count, seq, timestamp = HEADER.unpack_from(data)
+        if magic != WIRE_MAGIC or version != WIRE_VERSION:
+            raise ValueError(f"Unsupported frame: version={version} type={frame_type} fields={field_count}")
+        offset = HEADER.size
+        vehicle_id = None
+        if frame_type & FRAME_TAGGED:
+            vehicle_id = TAG.unpack_from(data, offset)[0]
+            offset += TAG.size
+            frame_type &= ~FRAME_TAGGED
+        if not self.wants(vehicle_id):
+            return None
+
+        state = self.delta_state.get(vehicle_id)
+        if frame_type == FRAME_SAMPLE and field_count == len(SAMPLE_FIELDS):
+            values = SAMPLE.unpack_from(data, offset)
+            # Duplicate or late, unless sent after our state: then the server restarted
+            if state is not None and (state[1] - seq) & 0xFFFFFFFF < LinkStats.RESTART_GAP \
+                    and timestamp <= state[2]:
+                return None
+        elif frame_type == FRAME_DELTA:
+            ahead = None if state is None else (seq - state[1]) & 0xFFFFFFFF
+            if ahead is None or ahead == 0 or ahead >= 0x80000000:
+                return None  # no state yet, duplicate or late
+            if ahead != 1:
+                # Missed a packet: the fields it changed are unknown until the next keyframe
+                del self.delta_state[vehicle_id]
+                self.resyncs += 1
+                return None
+            if len(data) <= offset:
+                raise ValueError("Truncated delta frame")
+            values = list(state[0])
+            mask = data[offset]
+            if mask >= len(DELTA_BODIES) or len(DELTA_FIELDS[mask]) != field_count:
+                raise ValueError(f"Unsupported delta mask: {mask:#x} for {field_count} fields")
+            changed = DELTA_BODIES[mask].unpack_from(data, offset)
+            for i, value in zip(DELTA_FIELDS[mask], changed[1:]):
+                values[i] = value
+        else:
+            raise ValueError(f"Unsupported frame: version={version} type={frame_type} fields={field_count}")
+
+        self.delta_state[vehicle_id] = (values, seq, timestamp)
+        speed, rpm, temp, fuel, gear = values
+        sample = {'SPEED': speed, 'RPM': rpm, 'TEMP': temp, 'FUEL': fuel, 'GEAR': str(gear),
+                  'SEQ': seq, 'TS': timestamp}
+        if vehicle_id is not None:
+            sample['ID'] = vehicle_id
+        return sample
+
+    def stats_for(self, vehicle_id):
+        if self.vehicle_id != FLEET_ALL:
+            return self.stats
+        stats = self.fleet_stats.get(vehicle_id)
+        if stats is None:
+            stats = self.fleet_stats[vehicle_id] = LinkStats()
+        return stats
+
+    def track(self, sample, coalesced=0):
+        # Feeds the history and link statistics, returns the ACK echoing the packet's
+        # sequence number, and vehicle id for a fleet stream, plus how many superseded
+        # datagrams it covers
+        now = time.time()
+        vehicle_id = sample.get('ID')
+        if self.vehicle_id == FLEET_ALL:
+            self.fleet[vehicle_id] = sample
+        elif self.history is not None:
+            self.history.append(sample, now)
+        seq = sample.get('SEQ')
+        if seq is None:
+            return b"ACK"
+        seq = int(seq)
+        self.stats_for(vehicle_id).add(seq, float(sample['TS']), now)
+        ack = b"ACK:%d" % seq if vehicle_id is None else b"ACK:%d:%d" % (seq, vehicle_id)
+        return ack + b";%d" % coalesced if coalesced else ack
+
+
+class Client(ClientBase):
+
+    MAX_BATCH = 256  # datagrams drained per wake-up before the next select
+
+    def __init__(self, udp_ip="localhost", udp_port=5005, wire_format=WIRE_AUTO, multicast_group=None,
+                 history_size=4096, receive_mode=RECEIVE_ALL, rcvbuf=None, ack=True, vehicle_id=None,
+                 multicast_port=MULTICAST_PORT):
+        super().__init__(udp_ip, udp_port, wire_format, multicast_group, history_size, vehicle_id, multicast_port, ack)
+        if receive_mode not in (RECEIVE_ALL, RECEIVE_LATEST):
+            raise ValueError(f"Unknown receive mode: {receive_mode}")
+        self.receive_mode = receive_mode
+        self.sock = self.make_socket()
+        if rcvbuf:
+            # Room for bursts while the thread is not scheduled, the OS may cap or double it
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.sock.setblocking(False)
+        self.control = self.make_control_socket() or self.sock
+        self.last_ready = 0.0
+
+    def send_ready(self):
+        self.last_ready = time.monotonic()
+        try:
+            self.control.sendto(self.ready_message(), (self.udp_ip, self.udp_port))
+        except OSError as e:
+            if self.running:
+                print(f"READY not sent: {e}")
+
+    def close(self):
+        # Leave the server's subscriber list right away instead of waiting for expiry
+        self.running = False
+        try:
+            self.control.sendto("BYE".encode(), (self.udp_ip, self.udp_port))
+        except OSError:
+            pass
+        if self.control is not self.sock:
+            self.control.close()
+        self.sock.close()
+
+    def drain(self):
+        # Every datagram already queued on the socket, up to MAX_BATCH
+        batch = []
+        for _ in range(self.MAX_BATCH):
+            try:
+                batch.append(self.sock.recvfrom(1024))
+            except BlockingIOError:
+                break
+            except ConnectionResetError:
+                # Windows reports ICMP port unreachable while the server is down
+                continue
+        return batch
+
+    def handle(self, data, addr, callback, deliver=True, coalesced=0):
+        # Parse the received data. A superseded datagram is only decoded when binary,
+        # so delta frames stay in step; it is neither delivered nor ACKed, the ACK of
+        # the newest one counts the coalesced datagrams it superseded instead
+        if not deliver:
+            vehicle_id = tagged_vehicle(data)
+            if self.wants(vehicle_id):
+                self.stats_for(vehicle_id).skip(1)
+            if data[:2] != WIRE_MAGIC:
+                return
+        try:
+            sample = self.decode_packet(data)
+        except (ValueError, struct.error) as e:
+            print(f"Dropped malformed packet from {addr}: {e}")
+            return
+        if sample is None or not deliver:
+            return
+        self.data_dict = sample
+        ack = self.track(self.data_dict, coalesced)
+
+        # Call the callback function with the received data
+        callback()
+
+        # Send acknowledgment back to the server
+        if self.ack:
+            try:
+                self.control.sendto(ack, addr)
+            except OSError as e:
+                print(f"ACK to {addr} not sent: {e}")
+
     def client_thread(self, callback):
         def run():
             # Notify server
-            self.sock.sendto("READY".encode(), (self.udp_ip, self.udp_port))
+            self.send_ready()
 
             print("Waiting for data...")
 
-            while True:
+            while self.running:
                 # Use select to wait for data on the socket
-                ready_sockets, _, _ = select.select([self.sock], [], [], None)
+                try:
+                    ready_sockets, _, _ = select.select([self.sock], [], [], self.READY_INTERVAL)
+                except (OSError, ValueError):
+                    # Socket closed by close()
+                    break
+                if not ready_sockets or (not self.ack and time.monotonic() - self.last_ready >= self.READY_INTERVAL):
+                    # Server not up yet, restarted or expired us, or ACKs are off: register again
+                    self.send_ready()
+                if not ready_sockets:
+                    continue
 
-                for s in ready_sockets:
-                    if s == self.sock:
-                        try:
-                            # Receive data packet from server
-                            data, addr = self.sock.recvfrom(1024)
-                            decoded_data = data.decode()
+                try:
+                    batch = self.drain()
+                    # In latest mode only the newest datagram per sender and vehicle is delivered
+                    if self.receive_mode == RECEIVE_LATEST:
+                        keys = [(addr, tagged_vehicle(data)) for data, addr in batch]
+                        newest = {key: i for i, key in enumerate(keys)}
+                        counts = collections.Counter(keys)
+                        for i, (data, addr) in enumerate(batch):
+                            self.handle(data, addr, callback, newest[keys[i]] == i, counts[keys[i]] - 1)
+                    else:
+                        for data, addr in batch:
+                            self.handle(data, addr, callback)
+                except ConnectionResetError:
+                    pass
+                except OSError:
+                    if not self.running:
+                        break
+                    raise
 
-                            # Parse the received data
-                            data_parts = decoded_data.split(',')
-                            self.data_dict = {key_value.split(':')[0]: key_value.split(':')[1] for key_value in data_parts}
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        print("Client thread started.")
 
-                            # Call the callback function with the received data
-                            #callback()
 
-                            # Send acknowledgment back to the server
-                            self.sock.sendto("ACK".encode(), addr)
+class AsyncClient(ClientBase, asyncio.DatagramProtocol):
+    # asyncio flavour of Client: no thread, the callback and next_sample() waiters
+    # run on the event loop that owns the transport
 
-                        except socket.timeout:
-                            print("Timeout waiting for data...")
+    def __init__(self, udp_ip="localhost", udp_port=5005, wire_format=WIRE_AUTO, multicast_group=None,
+                 callback=None, history_size=4096, vehicle_id=None, multicast_port=MULTICAST_PORT):
+        super().__init__(udp_ip, udp_port, wire_format, multicast_group, history_size, vehicle_id, multicast_port)
+        self.callback = callback
+        self.transport = None
+        self.control = None
+        self.ready_task = None
+        self.waiters = []
+        self.last_rx = 0.0
 
-        thread = threading.Thread(target=run, daemon=True)
-        thread.start()
-        print("Client thread started.")
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        sock = self.make_socket()
+        sock.setblocking(False)
+        await loop.create_datagram_endpoint(lambda: self, sock=sock)
+        self.control = self.make_control_socket()
+        self.send_ready()
+        self.ready_task = loop.create_task(self.ready_loop())
+        print("Waiting for data...")
+
+    async def ready_loop(self):
+        loop = asyncio.get_running_loop()
+        while self.running:
+            await asyncio.sleep(self.READY_INTERVAL)
+            if loop.time() - self.last_rx >= self.READY_INTERVAL:
+                # Server not up yet, restarted or expired us: register again
+                self.send_ready()
+
+    async def next_sample(self):
+        # Resolves with the next decoded sample
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        return await waiter
+
+    def send_control(self, message, addr):
+        # Through the control socket of a multicast client, else the transport
+        if self.control is not None:
+            try:
+                self.control.sendto(message, addr)
+            except OSError:
+                pass
+        elif self.transport is not None:
+            self.transport.sendto(message, addr)
+
+    def send_ready(self):
+        self.send_control(self.ready_message(), (self.udp_ip, self.udp_port))
+
+    def close(self):
+        self.running = False
+        if self.ready_task is not None:
+            self.ready_task.cancel()
+            self.ready_task = None
+        if self.transport is not None:
+            self.send_control("BYE".encode(), (self.udp_ip, self.udp_port))
+            self.transport.close()
+            self.transport = None
+        if self.control is not None:
+            self.control.close()
+            self.control = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            sample = self.decode_packet(data)
+        except (ValueError, struct.error) as e:
+            print(f"Dropped malformed packet from {addr}: {e}")
+            return
+        if sample is None:
+            return
+        self.data_dict = sample
+        self.last_rx = asyncio.get_running_loop().time()
+        self.send_control(self.track(self.data_dict), addr)
+
+        if self.callback is not None:
+            self.callback()
+        waiters, self.waiters = self.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(self.data_dict)
 
+    def error_received(self, exc):
+        # ICMP port unreachable while the server is down, READY is retried
+        pass